@@ -12,12 +12,16 @@
 # 2. entity resolution and temporal resolution
 # 3. general statistics from text
 
+from . import caching
 from . import extraction
 from . import preprocessing
 from . import readability
 from . import resolution
+from . import resources
+from . import shards
 from . import similarity
 from . import stat
+from . import stems
 from . import tokens
 from . import vectorizer
 from . import vocab_tools
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+###############################################################################
+# BENCHMARK: force_ascii
+# chars/sec of force_ascii before (per-character charmap join) and after
+# (compiled translate table) on mixed unicode clinical text.
+#
+# usage: python benchmarks/force_ascii.py [megabytes] [seed]
+# NOTE: run with text_tools importable (e.g. installed, or on PYTHONPATH)
+###############################################################################
+
+import sys
+import time
+import random
+
+from text_tools import preprocessing
+
+WORDS = (
+    "patient denies chest pain no evidence of fever negative for pneumonia "
+    "Dr. Smith saw pt. w/ COPD and CHF on 2019-03-04 at 10:30 am; BP 120/80 "
+    "café résumé naïve señor Ｎ 𝐻ello µg ½ tab Ø “quoted” – — … ° ± ß "
+    "Mr. Jones reports shortness-of-breath, e.g. etc. U.S.A. hx of DM2 "
+    "\n \t no significant signs of distress denied nausea without difficulty"
+).split(" ")
+
+
+def corpus(megabytes, seed=0):
+    """
+    return: list of documents totalling about megabytes of characters
+    """
+    rand = random.Random(seed)
+    texts = []
+    size = 0
+    while size < megabytes * 2 ** 20:
+        text = " ".join(
+            rand.choice(WORDS) for _ in range(rand.randint(50, 1500))
+        )
+        texts.append(text)
+        size += len(text)
+    return texts
+
+
+def bench(name, func, texts):
+    chars = sum(len(text) for text in texts)
+    start = time.time()
+    output = func(texts)
+    elapsed = time.time() - start
+    print("%-10s %.2e chars/s (%.2fs)" % (name, chars / elapsed, elapsed))
+    return output
+
+
+def main(megabytes=100, seed=0):
+    texts = corpus(megabytes, seed)
+    print(
+        "%d docs, %d chars"
+        % (len(texts), sum(len(text) for text in texts))
+    )
+    legacy = bench(
+        "legacy",
+        lambda x: preprocessing.force_ascii(x, translate=False),
+        texts,
+    )
+    translate = bench("translate", preprocessing.force_ascii, texts)
+    bulk = bench("bulk", preprocessing.force_ascii_bulk, texts)
+    assert (
+        legacy == translate == bulk
+    ), "Error: force_ascii modes disagree. Aborting."
+
+    # pure ascii takes the skip path
+    texts = [text.encode("ascii", "ignore").decode() for text in texts]
+    bench("ascii", preprocessing.force_ascii, texts)
+
+
+if __name__ == "__main__":
+    main(*[int(i) for i in sys.argv[1:3]])
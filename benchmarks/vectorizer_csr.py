@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+###############################################################################
+# BENCHMARK: vectorizer_csr
+# count, tb and tf matrices built with one dense row per document and a
+# vstack (the original implementation) against direct CSR construction,
+# asserting the matrices are identical. Both sides share one compiled vocab
+# regex, so the timings compare matrix building only.
+#
+# usage: python benchmarks/vectorizer_csr.py [vocab size] [documents] [seed]
+# NOTE: run with text_tools importable (e.g. installed, or on PYTHONPATH)
+###############################################################################
+
+import re
+import sys
+import time
+import random
+import scipy
+import numpy as np
+
+from text_tools import vectorizer, vocab_tools
+
+LETTERS = "abcdefghij"
+
+
+def dense_count(texts, vocab, regex):
+    # original count_vectorizer
+    hashdict = {k: v for v, k in enumerate(vocab)}
+    output = []
+    for i in range(len(texts)):
+        vector = np.zeros((1, len(vocab)))
+        for m in re.findall(regex, texts[i]):
+            vector[0, hashdict[m]] += 1
+        output.append(scipy.sparse.csr_matrix(vector))
+    return scipy.sparse.vstack(output)
+
+
+def dense_tb(texts, vocab, regex):
+    # original tb_vectorizer (serial path)
+    hashdict = {k: v for v, k in enumerate(vocab)}
+    output = []
+    for text in texts:
+        vector = np.zeros((1, len(hashdict)))
+        for m in set(re.findall(regex, text)):
+            vector[0, hashdict[m]] = 1
+        output.append(scipy.sparse.csr_matrix(vector))
+    return scipy.sparse.vstack(output)
+
+
+def dense_tf(texts, vocab, regex):
+    # original tf_vectorizer
+    hashdict = {k: v for v, k in enumerate(vocab)}
+    output = []
+    for i in range(len(texts)):
+        vector = np.zeros((1, len(vocab)))
+        for m in re.findall(regex, texts[i]):
+            vector[0, hashdict[m]] += 1
+        if np.count_nonzero(vector) == 0:
+            output.append(scipy.sparse.csr_matrix((1, len(vocab))))
+        else:
+            denominator = np.sqrt(np.sum(vector ** 2))
+            vector = vector / float(denominator)
+            output.append(scipy.sparse.csr_matrix(vector))
+    return scipy.sparse.vstack(output)
+
+
+def csr_count(texts, vocab, regex):
+    return vectorizer.count_vectorizer(texts, vocab, regex=regex)
+
+
+def csr_tb(texts, vocab, regex):
+    # tb_vectorizer's matrix, on the shared regex
+    return vectorizer.Vectorizer(vocab, mode="binary", regex=regex).transform(
+        texts
+    )
+
+
+def csr_tf(texts, vocab, regex):
+    return vectorizer.Vectorizer(vocab, mode="l2", regex=regex).transform(
+        texts
+    )
+
+
+def identical(a, b):
+    """
+    return: true if both matrices have the same shape, dtype, indptr,
+        indices and data (in canonical csr form)
+    """
+    a = scipy.sparse.csr_matrix(a)
+    b = scipy.sparse.csr_matrix(b)
+    for matrix in (a, b):
+        matrix.sum_duplicates()
+        matrix.sort_indices()
+    return (
+        a.shape == b.shape
+        and a.dtype == b.dtype
+        and np.array_equal(a.indptr, b.indptr)
+        and np.array_equal(a.indices, b.indices)
+        and np.array_equal(a.data, b.data)
+    )
+
+
+def main(n_vocab=200000, n_docs=2000, seed=0):
+    rand = random.Random(seed)
+    vocab = set()
+    while len(vocab) < n_vocab:
+        vocab.add(
+            "".join(rand.choice(LETTERS) for _ in range(rand.randint(3, 9)))
+        )
+    vocab = sorted(vocab)
+    texts = [
+        " ".join(rand.choice(vocab) for _ in range(200))
+        for _ in range(n_docs)
+    ]
+    texts.append("")  # a document without vocab
+    regex = vocab_tools.vocab_regex(vocab)
+    print("%d terms, %d documents" % (len(vocab), len(texts)))
+
+    for name, dense, csr in (
+        ("count", dense_count, csr_count),
+        ("tb", dense_tb, csr_tb),
+        ("tf", dense_tf, csr_tf),
+    ):
+        start = time.time()
+        old = dense(texts, vocab, regex)
+        old_time = time.time() - start
+        start = time.time()
+        new = csr(texts, vocab, regex)
+        new_time = time.time() - start
+        assert identical(old, new), (
+            "Error: %s matrices differ. Aborting." % name
+        )
+        print(
+            "%-6s dense+vstack %6.2fs   csr %6.2fs   identical"
+            % (name, old_time, new_time)
+        )
+
+
+if __name__ == "__main__":
+    main(*[int(i) for i in sys.argv[1:4]])
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+###############################################################################
+# BENCHMARK: vocab_regex
+# compile and findall time of the trie vocab_regex against the length-sorted
+# alternation it replaced, at 1k, 50k and 500k terms, and the one-off cost
+# of count_vectorizer (which compiles the vocab on every call).
+#
+# usage: python benchmarks/vocab_regex.py [sizes] [seed]
+#        e.g. python benchmarks/vocab_regex.py 1000,50000,500000
+# NOTE: run with text_tools importable (e.g. installed, or on PYTHONPATH)
+###############################################################################
+
+import re
+import sys
+import time
+import random
+
+from text_tools import vectorizer, vocab_tools
+
+LETTERS = "abcdefghijklmnopqrstuvwxyz"
+
+
+def make_vocab(n, rand):
+    """
+    return: n unique phrases of 1-3 words, some holding metacharacters
+    """
+    vocab = set()
+    while len(vocab) < n:
+        words = [
+            "".join(rand.choice(LETTERS) for _ in range(rand.randint(3, 9)))
+            for _ in range(rand.choice((1, 1, 1, 2, 3)))
+        ]
+        phrase = " ".join(words)
+        if rand.random() < 0.02:
+            phrase = phrase + rand.choice(("-ab", ".cd", "+ef"))
+        vocab.add(phrase)
+    vocab = sorted(vocab)
+    rand.shuffle(vocab)
+    return vocab
+
+
+def make_text(vocab, words, rand):
+    """
+    return: text of words tokens, half vocab phrases and half noise
+    """
+    return " ".join(
+        rand.choice(vocab)
+        if rand.random() < 0.5
+        else "".join(rand.choice(LETTERS) for _ in range(6))
+        for _ in range(words)
+    )
+
+
+def alternation_regex(vocab):
+    # the pre-trie vocab_regex, with every phrase escaped
+    vocab = sorted(vocab, key=len, reverse=True)
+    return re.compile(r"\b(" + r"|".join(map(re.escape, vocab)) + r")\b")
+
+
+def timed(func, *args):
+    re.purge()  # re caches compiled patterns; time a cold compile
+    start = time.time()
+    output = func(*args)
+    return output, time.time() - start
+
+
+def main(sizes=(1000, 50000, 500000), seed=0):
+    rand = random.Random(seed)
+    vocab = make_vocab(max(sizes), rand)
+    text = make_text(vocab[: min(sizes)], 10000, rand)
+    print("findall over %d chars" % len(text))
+    print("terms     alternation compile/match   trie compile/match   one-off")
+    for n in sizes:
+        terms = vocab[:n]
+        old, old_compile = timed(alternation_regex, terms)
+        old_matches, old_match = timed(old.findall, text)
+        new, new_compile = timed(vocab_tools.vocab_regex, terms)
+        new_matches, new_match = timed(new.findall, text)
+        assert (
+            old_matches == new_matches
+        ), "Error: trie and alternation matches differ. Aborting."
+        _, one_off = timed(vectorizer.count_vectorizer, text, terms)
+        print(
+            "%-8d  %6.2fs / %7.3fs           %6.2fs / %7.3fs   %6.2fs"
+            % (n, old_compile, old_match, new_compile, new_match, one_off)
+        )
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    sizes = (1000, 50000, 500000)
+    if args:
+        sizes = tuple(int(i) for i in args[0].split(","))
+    main(sizes, *[int(i) for i in args[1:2]])
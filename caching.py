@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+###############################################################################
+# MODULE: caching
+# content-addressed on-disk cache of preprocessed documents
+# documents are keyed on the hash of their text, the preprocessing stages and
+# the version of the lexicons those stages read, so retraining pipelines only
+# pay for new or changed documents.
+###############################################################################
+
+import time
+import sqlite3
+import hashlib
+from text_tools import preprocessing, resources
+
+
+class PreprocessCache(object):
+    """
+    sqlite-backed cache in front of preprocessing.preprocess
+    @param path: sqlite file, created if missing (":memory:" for tests)
+    @param max_bytes: evict least recently used documents beyond this size
+    @param negex, stem, stages: see preprocessing.Preprocessor
+    @param workers: if set, misses are preprocessed on a PreprocessPool
+        (batches of fewer than PARALLEL_MIN_TEXTS misses stay in-process)
+    """
+
+    def __init__(
+        self,
+        path,
+        max_bytes=2 ** 30,
+        negex=False,
+        stem=True,
+        stages=None,
+        workers=None,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self.hits = 0
+        self.misses = 0
+        self._preprocessor = preprocessing.Preprocessor(
+            negex=negex, stem=stem, stages=stages
+        )
+        self._pool = None
+
+        # options and lexicon version salt every key
+        stages = self._preprocessor.stages
+        lexicons = [
+            j for i in stages for j in preprocessing.STAGE_LEXICONS.get(i, ())
+        ]
+        self.version = hashlib.sha1(
+            (
+                "|".join(stages) + "|" + resources.fingerprint(lexicons)
+            ).encode("utf-8")
+        ).hexdigest()
+
+        self._db = sqlite3.connect(path)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS docs (key TEXT PRIMARY KEY, "
+            "value TEXT NOT NULL, size INTEGER NOT NULL, used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS docs_used ON docs(used)")
+        self._db.commit()
+        self._size = self._stored_bytes()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def preprocess(self, texts):
+        """
+        @param texts: string or iterable of strings
+        return: preprocessed string or list of strings, as preprocess()
+        """
+        if isinstance(texts, str):
+            return self.preprocess([texts])[0]
+        texts = list(texts)
+        keys = [self._key(text) for text in texts]
+        found = self._fetch(set(keys))
+        now = time.time()
+
+        # preprocess only the misses, each unique text once
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        if missing:
+            if self.workers:
+                if self._pool is None:
+                    self._pool = preprocessing.PreprocessPool(
+                        self.workers, stages=self._preprocessor.stages
+                    )
+                values = self._pool.map(missing.values())
+            else:
+                values = self._preprocessor.process_many(missing.values())
+            rows = [
+                (k, v, len(v.encode("utf-8", "surrogatepass")), now)
+                for k, v in zip(missing.keys(), values)
+            ]
+            self._db.executemany(
+                "INSERT OR REPLACE INTO docs VALUES (?, ?, ?, ?)", rows
+            )
+            self._size += sum(i[2] for i in rows)
+            found.update((i[0], i[1]) for i in rows)
+
+        # bookkeeping
+        self._db.executemany(
+            "UPDATE docs SET used = ? WHERE key = ?",
+            [(now, k) for k in set(keys) if k not in missing],
+        )
+        self._db.commit()
+        self.misses += len(missing)
+        self.hits += len(keys) - len(missing)
+        if self._size > self.max_bytes:
+            self._evict()
+        return [found[key] for key in keys]
+
+    def stats(self):
+        """
+        return: dict of hits, misses, hit rate, entries and bytes stored
+        """
+        entries = self._db.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / float(total) if total else 0.0,
+            "entries": entries,
+            "bytes": self._size,
+            "max_bytes": self.max_bytes,
+        }
+
+    def clear(self):
+        self._db.execute("DELETE FROM docs")
+        self._db.commit()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+        self._db.close()
+
+    def _key(self, text):
+        digest = hashlib.sha1(self.version.encode("utf-8"))
+        digest.update(text.encode("utf-8", "surrogatepass"))
+        return digest.hexdigest()
+
+    def _fetch(self, keys):
+        # sqlite caps bound parameters, so look up in batches
+        keys = list(keys)
+        found = {}
+        for i in range(0, len(keys), 500):
+            batch = keys[i : i + 500]
+            found.update(
+                self._db.execute(
+                    "SELECT key, value FROM docs WHERE key IN (%s)"
+                    % ",".join("?" * len(batch)),
+                    batch,
+                ).fetchall()
+            )
+        return found
+
+    def _stored_bytes(self):
+        return self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM docs"
+        ).fetchone()[0]
+
+    def _evict(self):
+        # drop least recently used documents until under max_bytes
+        size = self._stored_bytes()
+        if size <= self.max_bytes:
+            self._size = size
+            return
+        stale = []
+        for key, entry_size in self._db.execute(
+            "SELECT key, size FROM docs ORDER BY used"
+        ):
+            stale.append((key,))
+            size -= entry_size
+            if size <= self.max_bytes:
+                break
+        self._db.executemany("DELETE FROM docs WHERE key = ?", stale)
+        self._db.commit()
+        self._size = size
@@ -9,17 +9,64 @@
 
 import re
 import math
-from bisect import bisect_left, bisect_right
+import numpy as np
 from text_tools.vocab_tools import vocab_regex
 from text_tools.resolution import fetch_dates
 
 
-def build_convolutions(texts, windowsize=100, step=50, metadata=False):
+def build_convolutions(
+    texts, windowsize=100, step=50, metadata=False, lazy=False
+):
     """
     return: list of tuples (page,wordid_start,wordid_end,text)
     @param text: string or list of strings
     @param windowsize: windowsize of sliding window in characters
     @param step: step size used
+    @param lazy: return the text windows as a WindowSet (pages kept once,
+        windows as offsets) rather than a list of strings
+    NOTE: windows come from convolution_offsets; use it directly to keep
+        offsets and materialize text only where needed
+    """
+    # initialize
+    if isinstance(texts, str):
+        texts = [texts]
+    pages, starts, ends, token_starts, token_ends = convolution_offsets(
+        texts, windowsize, step
+    )
+    if lazy and not metadata:
+        return WindowSet(texts, pages - 1, starts, ends)
+    windows = [
+        texts[p - 1][s:e].strip()
+        for p, s, e in zip(pages.tolist(), starts.tolist(), ends.tolist())
+    ]
+
+    # if metadata requested
+    if metadata:
+        if windows:
+            return list(
+                zip(
+                    pages.tolist(),
+                    token_starts.tolist(),
+                    token_ends.tolist(),
+                    windows,
+                )
+            )
+        else:
+            return [(0, 0, 0, "")]
+
+    # else just text windows
+    return windows
+
+
+def convolution_offsets(texts, windowsize=100, step=50):
+    """
+    sliding windows over texts, snapped to space-delimited words, as arrays
+    @param texts: string or list of strings
+    @param windowsize: windowsize of sliding window in characters
+    @param step: step size used
+    return: (page, start, end, wordid_start, wordid_end) int arrays with a
+        row per window; texts[page - 1][start:end].strip() is its text.
+        Pages count from 1, word ids from 1 across all pages.
     """
     # initialize
     if isinstance(texts, str):
@@ -32,23 +79,29 @@ def build_convolutions(texts, windowsize=100, step=50, metadata=False):
     token_count = 0
     for page_num in range(len(texts)):
 
-        # define the delimiters
+        # define the delimiters, the starts of space-delimited words
         text = texts[page_num].strip()
         if not text:
             continue
+        lead = len(texts[page_num]) - len(texts[page_num].lstrip())
         textlen = len(text)
-        delimiters = [m.start() + 1 for m in re.finditer(r" ", text)]
-        if 0 not in delimiters:
-            delimiters = [0] + delimiters
+        codes = np.frombuffer(
+            text.encode("utf-32-le", "surrogatepass"), dtype=np.uint32
+        )
+        delimiters = np.concatenate(([0], np.flatnonzero(codes == 32) + 1))
 
         # shortcircuit on small text
-        if textlen <= windowsize and text:
+        if textlen <= windowsize:
             output.append(
-                (
-                    page_num + 1,
-                    token_count + 1,
-                    token_count + len(delimiters),
-                    text,
+                np.array(
+                    [
+                        [page_num + 1],
+                        [lead],
+                        [lead + textlen],
+                        [token_count + 1],
+                        [token_count + len(delimiters)],
+                    ],
+                    dtype=np.int64,
                 )
             )
             token_count += len(delimiters)
@@ -58,56 +111,132 @@ def build_convolutions(texts, windowsize=100, step=50, metadata=False):
         if windowsize % 2 == 0:
             windowsize -= 1
         radius = int((windowsize - 1) / 2)
-        idx_s = radius
         idx_e = radius + step * (
             1 + math.floor((textlen - (2 * radius) - 1) / step)
         )
 
-        # get span candidates and their center indices
-        spans = [
-            (max(i - radius, 0), min(i + radius + 1, textlen))
-            for i in range(idx_s, idx_e, step)
-        ]
+        # span candidates from their center indices
+        centers = np.arange(radius, idx_e, step)
+        span_s = centers - radius
+        span_e = np.minimum(centers + radius + 1, textlen)
 
         # delimit to defined delimiters
-        span_output = []
-        for i in range(len(spans)):
-            s = bisect_left(delimiters, spans[i][0])
-            if s >= len(delimiters):
-                continue
-            s = delimiters[s]
-            e = delimiters[bisect_right(delimiters, spans[i][1]) - 1]
-            if s < e:
-                span_output.append((s, e))
-        span_output = _remove_duplicates_maintain_order(span_output)
+        s = np.searchsorted(delimiters, span_s, side="left")
+        e = np.searchsorted(delimiters, span_e, side="right") - 1
+        keep = s < len(delimiters)
+        s, e = s[keep], e[keep]
+        keep = delimiters[s] < delimiters[e]
+        s, e = s[keep], e[keep]
+
+        # spans only grow left to right, so duplicates are adjacent
+        if len(s):
+            keep = np.ones(len(s), dtype=bool)
+            keep[1:] = (s[1:] != s[:-1]) | (e[1:] != e[:-1])
+            s, e = s[keep], e[keep]
 
         # append findings for that page
-        token_dict = dict(
-            map(
-                lambda t: (t[1], t[0]),
-                enumerate(delimiters, start=token_count + 1),
-            )
+        output.append(
+            np.vstack(
+                (
+                    np.full(len(s), page_num + 1),
+                    delimiters[s] + lead,
+                    delimiters[e] + lead,
+                    s + token_count + 1,
+                    e + token_count,
+                )
+            ).astype(np.int64)
         )
-        output += [
-            (
-                page_num + 1,
-                token_dict[i[0]],
-                token_dict[i[1]] - 1,
-                text[i[0] : i[1]].strip(),
-            )
-            for i in span_output
-        ]
         token_count += len(delimiters)
 
-    # if metadata requested
-    if metadata:
-        if output:
-            return output
-        else:
-            return [(0, 0, 0, "")]
+    if not output:
+        return tuple(np.zeros(0, dtype=np.int64) for _ in range(5))
+    return tuple(np.concatenate(output, axis=1))
 
-    # else just text windows
-    return [i[3] for i in output]
+
+class WindowSet(object):
+    """
+    windows over a list of pages, stored as the pages once plus int32 offset
+    arrays; behaves like the list of window strings build_convolutions
+    returns (len, iteration, indexing), materializing text on access
+    @param texts: list of pages
+    @param pages: page index (from 0) of each window
+    @param starts: start offset of each window in its page
+    @param ends: end offset of each window in its page
+    NOTE: a window's text is texts[page][start:end].strip(). The vectorizers
+        match a WindowSet once per page and attribute hits to windows by
+        offset rather than re-matching overlapping text.
+    """
+
+    def __init__(self, texts, pages, starts, ends):
+        if isinstance(texts, str):
+            texts = [texts]
+        self.texts = list(texts)
+        self.pages = np.asarray(pages, dtype=np.int32)
+        self.starts = np.asarray(starts, dtype=np.int32)
+        self.ends = np.asarray(ends, dtype=np.int32)
+        assert (
+            len(self.pages) == len(self.starts) == len(self.ends)
+        ), "Error: pages, starts and ends must be the same length. Aborting."
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __iter__(self):
+        texts = self.texts
+        for p, s, e in zip(
+            self.pages.tolist(), self.starts.tolist(), self.ends.tolist()
+        ):
+            yield texts[p][s:e].strip()
+
+    def __getitem__(self, key):
+        """
+        @param key: window number, slice, or array of window numbers/mask
+        return: window text for a number, else a WindowSet of the windows
+        """
+        if isinstance(key, (int, np.integer)):
+            return self.texts[self.pages[key]][
+                self.starts[key] : self.ends[key]
+            ].strip()
+        return WindowSet(
+            self.texts, self.pages[key], self.starts[key], self.ends[key]
+        )
+
+    def __eq__(self, other):
+        # equal to any sequence of the same window strings
+        try:
+            return list(self) == list(other)
+        except TypeError:
+            return NotImplemented
+
+    # mutable arrays and list-like equality, so unhashable like a list
+    __hash__ = None
+
+    def __add__(self, other):
+        """
+        return: WindowSet of the windows of self then other, pages of both
+        """
+        if not isinstance(other, WindowSet):
+            return NotImplemented
+        return WindowSet(
+            self.texts + other.texts,
+            np.concatenate((self.pages, other.pages + len(self.texts))),
+            np.concatenate((self.starts, other.starts)),
+            np.concatenate((self.ends, other.ends)),
+        )
+
+    def tolist(self):
+        """
+        return: list of the window strings
+        """
+        return list(self)
+
+    def spans(self):
+        """
+        return: list of (page, start, end) offsets, pages from 0
+        """
+        return list(
+            zip(self.pages.tolist(), self.starts.tolist(), self.ends.tolist())
+        )
 
 
 def windows_by_index(text, indices, radius, return_index=False):
@@ -121,19 +250,15 @@ def windows_by_index(text, indices, radius, return_index=False):
     # initialize
     if isinstance(indices, int):
         indices = [indices]
-    wordbounds = [m.start() for m in re.finditer(r"\b", text)]
     textmax = len(text)
-    indices = [i for i in indices if i >= 0 and i < textmax]
+    indices = np.array(
+        [i for i in indices if i >= 0 and i < textmax], dtype=np.int64
+    )
 
     # for each index, move to word boundaries
+    starts, ends = snap_windows(text, indices - radius, indices + radius)
     output = []
-    for j in indices:
-        start = max(j - radius, 0)
-        end = min(j + radius, textmax)
-        while start not in wordbounds and start != textmax:
-            start += 1
-        while end not in wordbounds and end != 0:
-            end -= 1
+    for start, end in zip(starts.tolist(), ends.tolist()):
         if return_index:
             output.append((text[start:end], start))
         else:
@@ -147,33 +272,53 @@ def windows_by_terms(texts, terms, radius=50, ignore_case=False):
     @param text: string or list of texts
     @param term: term to use
     @param radius: character radius to use
-    @param punct_delimit: If true, stops on case of first stop punct
+    @param ignore_case: match terms regardless of case
+    """
+    return term_windows(
+        texts, terms, radius=radius, ignore_case=ignore_case, return_text=True
+    )[3]
+
+
+def term_windows(
+    texts, terms, radius=50, ignore_case=False, return_text=False
+):
+    """
+    batch windows centered on every occurrence of any of terms
+    @param texts: string or list of texts
+    @param terms: term or list of terms
+    @param radius: character radius to use
+    @param ignore_case: match terms regardless of case
+    @param return_text: also return the list of window strings
+    return: (text number, start, end) int arrays, a row per occurrence in
+        order, with offsets snapped to word boundaries
     """
     # initialize
     if isinstance(texts, str):
         texts = [texts]
-    regex = vocab_regex(terms, ignorecase=False)
-    regex_bounds = re.compile(r"\b")
+    regex = vocab_regex(terms, ignorecase=ignore_case)
     output = []
 
-    # for each text input
+    # for each text input, snap every occurrence against one boundary index
     for i in range(len(texts)):
+        locs = [m.span() for m in regex.finditer(texts[i])]
+        if not locs:
+            continue
+        locs = np.array(locs, dtype=np.int64)
+        starts, ends = snap_windows(
+            texts[i], locs[:, 0] - radius, locs[:, 1] + radius
+        )
+        output.append((np.full(len(starts), i, dtype=np.int64), starts, ends))
 
-        # get start indices
-        textmax = len(texts[i])
-        locs = re.finditer(regex, texts[i])
-        locs = [(m.start(), m.end()) for m in locs]
-        wordbounds = [m.start() for m in re.finditer(regex_bounds, texts[i])]
-
-        # for each index, move to word boundaries
-        for j in locs:
-            start = max(j[0] - radius, 0)
-            end = min(j[1] + radius, textmax)
-            while start not in wordbounds and start != textmax:
-                start += 1
-            while end not in wordbounds and end != 0:
-                end -= 1
-            output.append(texts[i][start:end])
+    if output:
+        output = tuple(np.concatenate(i) for i in zip(*output))
+    else:
+        output = tuple(np.zeros(0, dtype=np.int64) for _ in range(3))
+    if return_text:
+        windows = [
+            texts[i][s:e]
+            for i, s, e in zip(*[j.tolist() for j in output])
+        ]
+        return output + (windows,)
     return output
 
 
@@ -186,34 +331,63 @@ def windows_by_dates(texts, radius, return_dates=False):
     # initialize
     if isinstance(texts, str):
         texts = [texts]
-    regex_bounds = re.compile(r"\b")
     output_spans = []
     output_dateobjs = []
 
     # for each text input
     for i in range(len(texts)):
 
-        textmax = len(texts[i])
         dateobjs, locs = fetch_dates(texts[i], return_ci=True)
-        wordbounds = [m.start() for m in re.finditer(regex_bounds, texts[i])]
         output_dateobjs += dateobjs
+        if not len(locs):
+            continue
 
         # for each index, move to word boundaries
-        for j in locs:
-            start = max(j - radius, 0)
-            end = min(j + radius, textmax)
-            while start not in wordbounds and start != textmax:
-                start += 1
-            while end not in wordbounds and end != 0:
-                end -= 1
-            output_spans.append(texts[i][start:end])
+        locs = np.asarray(locs, dtype=np.int64)
+        starts, ends = snap_windows(texts[i], locs - radius, locs + radius)
+        output_spans += [
+            texts[i][s:e] for s, e in zip(starts.tolist(), ends.tolist())
+        ]
     if return_dates:
         return list(zip(output_spans, output_dateobjs))
     return output_spans
 
 
-def _remove_duplicates_maintain_order(seq):
-    # removed duplicates maintaining order
-    seen = set()
-    seen_add = seen.add
-    return [x for x in seq if not (x in seen or seen_add(x))]
+def word_bounds(text):
+    """
+    return: sorted int array of the word boundary (regex \\b) offsets of text
+    """
+    return np.array(
+        [m.start() for m in _RE_WORD_BOUNDS.finditer(text)], dtype=np.int64
+    )
+
+
+def snap_windows(text, starts, ends, bounds=None):
+    """
+    narrow windows of text to word boundaries
+    @param text: string the windows index
+    @param starts: window start offsets (clipped to the text)
+    @param ends: window end offsets (clipped to the text)
+    @param bounds: word_bounds(text), if already computed for the text
+    return: (starts, ends) int arrays; each start moves right to the next
+        word boundary (or the end of text), each end left to the previous
+        word boundary (or 0)
+    """
+    textmax = len(text)
+    if bounds is None:
+        bounds = word_bounds(text)
+    starts = np.clip(np.asarray(starts, dtype=np.int64), 0, textmax)
+    ends = np.clip(np.asarray(ends, dtype=np.int64), 0, textmax)
+    if not len(bounds):
+        empty = np.zeros(len(starts), dtype=np.int64)
+        return empty + textmax, empty
+    k = np.searchsorted(bounds, starts, side="left")
+    starts = np.where(
+        k < len(bounds), bounds[np.minimum(k, len(bounds) - 1)], textmax
+    )
+    k = np.searchsorted(bounds, ends, side="right") - 1
+    ends = np.where(k >= 0, bounds[np.maximum(k, 0)], 0)
+    return starts, ends
+
+
+_RE_WORD_BOUNDS = re.compile(r"\b")
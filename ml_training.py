@@ -117,7 +117,7 @@ def wiki_ensemble(
     return_vocab = False
     if not vocab:
         return_vocab = True
-        vocab = vocab_tools.build_vocab("\n".join(articles.values()))
+        vocab = vocab_tools.count_vocab(articles.values())[0]
 
     # preprocess and vectorize
     articles = {k: preprocessing.preprocess(v) for k, v in articles.items()}
@@ -81,7 +81,9 @@ def plot_confidences(text, ensemble, vocab, windowsize, step=5):
     if isinstance(text, list):
         text = "\n".join(text)
     text = preprocessing.preprocess(text)
-    windows = extraction.build_convolutions(text, windowsize, step=step)
+    windows = extraction.build_convolutions(
+        text, windowsize, step=step, lazy=True
+    )
     vectors = vectorizer.tb_vectorizer(windows, vocab)
     classifier_names = [i for i in ensemble.keys()]
 
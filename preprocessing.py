@@ -1,65 +1,402 @@
 # -*- coding: utf-8 -*-
 # module for basic preprocessing of text
 
-import os
 import re
+import sys
+import math
+import time
+import atexit
 import random
-import pickle
+import numpy as np
 import text_tools
-from copy import copy
-from stemming.porter2 import stem
 import pyap
+from bisect import bisect_left, bisect_right
+from functools import partial
 from itertools import chain
+from multiprocessing import Pool, cpu_count
+from text_tools import resources, stems
+
+
+PREPROCESS_STAGES = (
+    "lower",
+    "punct",
+    "false_periods",
+    "abbr",
+    "ascii",
+    "negex",
+    "stem",
+)
+
+# lexicons each stage reads from resources
+STAGE_LEXICONS = {
+    "abbr": ("abbr_dict", "abbr_pattern"),
+    "ascii": ("charmap",),
+    "negex": ("negex",),
+}
 
 
 def preprocess(text, negex=False, stem=True):
     """
     fully preprocess a string or list of strings
+    NOTE: for repeated calls build a Preprocessor once and reuse it
     """
-    text = force_lower(text)  # does not impact space count
-    text = force_punct(text)  # does not impact space count
-    text = remove_false_periods(text)  # does not impact space count
-    text = force_abbr(text)  # does not impact space count
-    text = force_ascii(text) # does not impact space count
-    if negex:
-        text = drop_negex(text)  # does not impact space count
-    if stem:
-        text = stem_all(text)  # does not impact space count
-    return text
+    return Preprocessor(negex=negex, stem=stem).process(text)
+
+
+def iter_preprocess(texts, negex=False, stem=True):
+    """
+    lazy preprocess(): yields each text of an iterable as it is consumed
+    """
+    return Preprocessor(negex=negex, stem=stem).process_iter(texts)
+
+
+def stream(func, texts, **kwargs):
+    """
+    lazily apply a preprocessing function to each text of an iterable
+    @param func: function of this module taking a string (e.g. force_punct)
+    @param texts: iterable of strings, or a generator from another stream()
+    @param kwargs: keyword arguments passed to func
+    return: generator of func(text, **kwargs) per text
+    """
+    for text in texts:
+        yield func(text, **kwargs)
+
+
+def preprocess_parallel(
+    texts, workers=None, chunksize=None, negex=False, stem=True, stats=False
+):
+    """
+    preprocess() over a persistent process pool, order preserved
+    @param texts: iterable of strings
+    @param workers: number of worker processes, default cpu_count()
+    @param chunksize: texts shipped to a worker per task
+    @param stats: if true return (texts, stats) where stats holds docs,
+        chars, seconds and docs/chars per second
+    NOTE: the pool for each (workers, negex, stem) is started on first use
+        and reused by later calls until close_pools()
+    """
+    workers = workers or cpu_count()
+    key = (workers, negex, stem)
+    if key not in _pools:
+        _pools[key] = PreprocessPool(workers, negex=negex, stem=stem)
+    output = _pools[key].map(texts, chunksize=chunksize)
+    if stats:
+        return output, _pools[key].stats
+    return output
+
+
+def close_pools():
+    """
+    shut down the pools started by preprocess_parallel
+    """
+    while _pools:
+        _pools.popitem()[1].close()
+
+
+_pools = {}
+atexit.register(close_pools)
+
+
+class Preprocessor(object):
+    """
+    preprocess() configured and compiled once, then reused across texts
+    @param negex: uppercase negated phrases (see drop_negex)
+    @param stem: stem alphabetic tokens (see stem_all)
+    @param stages: ordered subset of PREPROCESS_STAGES, overrides negex/stem
+    NOTE: lexicons and regexes are resolved at construction and every text
+        runs through all stages as one string, without the per-stage list
+        copies of the individual force_* functions. Output is identical to
+        chaining those functions.
+    """
+
+    def __init__(self, negex=False, stem=True, stages=None):
+        if stages is None:
+            stages = [
+                i
+                for i in PREPROCESS_STAGES
+                if (i != "negex" or negex) and (i != "stem" or stem)
+            ]
+        stages = list(stages)
+        for i in stages:
+            assert (
+                i in PREPROCESS_STAGES
+            ), "Error: unknown preprocessing stage '%s'. Aborting." % i
+        self.stages = stages
+
+        # resolve every stage to a single-text callable
+        steps = {
+            "lower": str.lower,
+            "punct": _force_punct_text,
+            "false_periods": _remove_false_periods_text,
+            "abbr": partial(
+                _force_abbr_text,
+                abbr_dict=resources.get("abbr_dict"),
+                abbr_pattern=resources.get("abbr_pattern"),
+            ),
+            "ascii": _ascii_translator(resources.get("charmap")).translate,
+            "negex": partial(
+                _drop_negex_text,
+                re_punct=_RE_NEGEX_PUNCT,
+                patterns=resources.get("negex"),
+            ),
+            "stem": _stem_text,
+        }
+        self._steps = [steps[i] for i in stages]
+
+    def __call__(self, texts):
+        return self.process(texts)
+
+    def process(self, texts):
+        """
+        @param texts: string or list of strings
+        return: preprocessed string or list of strings
+        """
+        if isinstance(texts, str):
+            return self._run(texts)
+        return self.process_many(texts)
+
+    def process_many(self, texts):
+        """
+        @param texts: iterable of strings
+        return: list of preprocessed strings, in input order
+        """
+        run = self._run
+        return [run(text) for text in texts]
+
+    def process_iter(self, texts):
+        """
+        @param texts: iterable of strings (e.g. an open file)
+        return: generator of preprocessed strings, evaluated lazily
+        """
+        run = self._run
+        for text in texts:
+            yield run(text)
+
+    def _run(self, text):
+        for step in self._steps:
+            text = step(text)
+        return text
+
+
+# below this many texts pool start-up and shipping cost more than they save
+PARALLEL_MIN_TEXTS = 1000
+
+
+class PreprocessPool(object):
+    """
+    persistent process pool running a Preprocessor in every worker
+    @param workers: number of worker processes, default cpu_count()
+    @param negex, stem, stages: see Preprocessor
+    @param min_parallel: inputs with fewer texts stay in-process
+    NOTE: each worker builds its Preprocessor, and so loads the lexicons,
+        once at start-up. The pool starts on first parallel use; use as a
+        context manager or call close().
+    """
+
+    def __init__(
+        self,
+        workers=None,
+        negex=False,
+        stem=True,
+        stages=None,
+        min_parallel=None,
+    ):
+        self.workers = workers or cpu_count()
+        self.min_parallel = min_parallel
+        if min_parallel is None:
+            self.min_parallel = PARALLEL_MIN_TEXTS
+        self.stats = {}
+        self._preprocessor = Preprocessor(
+            negex=negex, stem=stem, stages=stages
+        )
+        self._initargs = (negex, stem, stages)
+        self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def map(self, texts, chunksize=None):
+        """
+        @param texts: iterable of strings
+        @param chunksize: texts per task, default spreads ~4 tasks per worker
+        return: list of preprocessed strings, in input order
+        """
+        start = time.time()
+        texts = list(texts)
+        if not chunksize:
+            chunksize = min(
+                1000, max(1, int(math.ceil(len(texts) / (4.0 * self.workers))))
+            )
+
+        # small inputs stay in-process
+        if self.workers < 2 or len(texts) < self.min_parallel:
+            output = self._preprocessor.process_many(texts)
+        else:
+            if self._pool is None:
+                self._pool = Pool(
+                    self.workers,
+                    initializer=_init_preprocess_worker,
+                    initargs=self._initargs,
+                )
+            chunks = [
+                texts[i : i + chunksize]
+                for i in range(0, len(texts), chunksize)
+            ]
+            output = list(
+                chain.from_iterable(
+                    self._pool.imap(_preprocess_worker_chunk, chunks)
+                )
+            )
+        self._record(texts, time.time() - start)
+        return output
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def _record(self, texts, seconds):
+        chars = sum(len(text) for text in texts)
+        seconds = max(seconds, 1e-9)
+        self.stats = {
+            "docs": len(texts),
+            "chars": chars,
+            "seconds": seconds,
+            "docs_per_sec": len(texts) / seconds,
+            "chars_per_sec": chars / seconds,
+        }
 
 
-def force_ascii(texts):
-    texts = copy(texts)
+def _init_preprocess_worker(negex, stem, stages):
+    global _worker_preprocessor
+    _worker_preprocessor = Preprocessor(negex=negex, stem=stem, stages=stages)
+
+
+def _preprocess_worker_chunk(texts):
+    return _worker_preprocessor.process_many(texts)
+
+
+def force_ascii(texts, translate=True):
+    """
+    @param texts: string or list of strings
+    @param translate: use the compiled str.translate table (fast), else map
+        each character through the charmap dict
+    return: texts with every character mapped to ascii via charmap, "_" if
+        unmapped
+    """
     strBOOL = False
     if isinstance(texts, str):
         texts = [texts]
         strBOOL = True
+    else:
+        texts = list(texts)
 
     # check hashmap for each char else use "_"
-    charmap = pickle.load(
-        open(
-            os.path.join(
-                os.path.dirname(os.path.realpath(__file__)),
-                "pickles",
-                "charmap",
-            ),
-            "rb",
-        )
-    )
-    for i in range(len(texts)):
-        texts[i] = "".join([charmap.get(i, "_") for i in texts[i]])
+    charmap = resources.get("charmap")
+    if translate:
+        translator = _ascii_translator(charmap)
+        for i in range(len(texts)):
+            texts[i] = translator.translate(texts[i])
+    else:
+        for i in range(len(texts)):
+            texts[i] = _force_ascii_text(texts[i], charmap)
 
     if strBOOL == True:
         return texts[0]
     return texts
 
 
+def force_ascii_bulk(texts):
+    """
+    force_ascii over a whole list, or one large buffer, with the charmap
+    table looked up once for all texts
+    @param texts: string buffer or iterable of strings
+    return: translated string or list of strings
+    """
+    translate = _ascii_translator(resources.get("charmap")).translate
+    if isinstance(texts, str):
+        return translate(texts)
+    return [translate(text) for text in texts]
+
+
+def _force_ascii_text(text, charmap):
+    return "".join([charmap.get(i, "_") for i in text])
+
+
+class _AsciiTable(dict):
+    # str.translate table where unmapped characters become "_"
+    def __missing__(self, key):
+        self[key] = "_"
+        return "_"
+
+
+class _AsciiTranslator(object):
+    """
+    charmap compiled to a lookup table indexed by codepoint
+    NOTE: str.translate with a dict table is no faster than the per-char join
+        on non-latin text, so single-character ascii mappings are applied
+        with numpy over the utf-32 code units. Other charmaps fall back to
+        str.translate. Ascii text holding none of the ascii characters that
+        charmap remaps (control characters, tabs, returns) is returned as-is.
+    """
+
+    def __init__(self, charmap):
+        self.charmap = charmap
+        mapping = {
+            k: v
+            for k, v in charmap.items()
+            if isinstance(k, str) and len(k) == 1
+        }
+        self.table = _AsciiTable({ord(k): v for k, v in mapping.items()})
+        self.lut = None
+        if all(len(v) == 1 and v.isascii() for v in mapping.values()):
+            self.lut = np.full(sys.maxunicode + 1, ord("_"), dtype=np.uint8)
+            for k, v in mapping.items():
+                self.lut[ord(k)] = ord(v)
+        remapped = "".join(
+            [chr(i) for i in range(128) if self.table[i] != chr(i)]
+        )
+        self.re_remapped = None
+        if remapped:
+            self.re_remapped = re.compile("[" + re.escape(remapped) + "]")
+
+    def translate(self, text):
+        if text.isascii() and (
+            self.re_remapped is None or not self.re_remapped.search(text)
+        ):
+            return text
+        if self.lut is not None:
+            codes = np.frombuffer(
+                text.encode("utf-32-le", "surrogatepass"), dtype=np.uint32
+            )
+            return self.lut[codes].tobytes().decode("ascii")
+        return text.translate(self.table)
+
+
+_ascii_translators = {}
+
+
+def _ascii_translator(charmap):
+    # compiled once per charmap object (resources.override swaps the object)
+    translator = _ascii_translators.get(id(charmap))
+    if translator is None or translator.charmap is not charmap:
+        translator = _AsciiTranslator(charmap)
+        _ascii_translators.clear()
+        _ascii_translators[id(charmap)] = translator
+    return translator
+
+
 def force_lower(texts):
-    texts = copy(texts)
     strBOOL = False
     if isinstance(texts, str):
         texts = [texts]
         strBOOL = True
+    else:
+        texts = list(texts)
 
     for i in range(len(texts)):
         texts[i] = texts[i].lower()
@@ -70,80 +407,71 @@ def force_lower(texts):
 
 
 def force_punct(texts, all_punct=False):
-    texts = copy(texts)
     strBOOL = False
     if isinstance(texts, str):
         texts = [texts]
         strBOOL = True
-
-    # precompile
-    re_ws = re.compile(
-        r"[-_/<>](?=[a-z])|(?<=[a-z])[-_/<>]"
-    )  # replace underscores/dashes/slashes/html tags with nothing
-    re_punct = re.compile(
-        "[%s]" % re.escape("!\"#$%&'()*+,-./:;<=>?@[\\]^_`{|}~•—")
-    )
-    re_spaces = re.compile(r"[ ]{2,}")  # simplify multi-spaces
-    re_dots = re.compile(r"[.]{2,}")  # simplify multi-periods
-    re_poss = re.compile(r"\b'\b")  # drop posessions/contractions
+    else:
+        texts = list(texts)
 
     # perform
     for i in range(len(texts)):
-        texts[i] = re.sub(re_ws, r" ", texts[i])
-        if all_punct:
-            texts[i] = re.sub(re_punct, " ", texts[i])
-        texts[i] = re.sub(re_spaces, r" ", texts[i])
-        texts[i] = re.sub(re_poss, r" ", texts[i])
-        texts[i] = re.sub(re_dots, r".", texts[i])
+        texts[i] = _force_punct_text(texts[i], all_punct)
 
     if strBOOL == True:
         return texts[0]
     return texts
 
 
+# precompiled for force_punct
+_RE_WS = re.compile(
+    r"[-_/<>](?=[a-z])|(?<=[a-z])[-_/<>]"
+)  # replace underscores/dashes/slashes/html tags with nothing
+_RE_PUNCT = re.compile(
+    "[%s]" % re.escape("!\"#$%&'()*+,-./:;<=>?@[\\]^_`{|}~•—")
+)
+_RE_SPACES = re.compile(r"[ ]{2,}")  # simplify multi-spaces
+_RE_DOTS = re.compile(r"[.]{2,}")  # simplify multi-periods
+_RE_POSS = re.compile(r"\b'\b")  # drop posessions/contractions
+
+
+def _force_punct_text(text, all_punct=False):
+    text = _RE_WS.sub(r" ", text)
+    if all_punct:
+        text = _RE_PUNCT.sub(" ", text)
+    text = _RE_SPACES.sub(r" ", text)
+    text = _RE_POSS.sub(r" ", text)
+    return _RE_DOTS.sub(r".", text)
+
+
 def force_abbr(texts):
-    texts = copy(texts)
     strBOOL = False
     if isinstance(texts, str):
         texts = [texts]
         strBOOL = True
+    else:
+        texts = list(texts)
 
-    abbr_dict = pickle.load(
-        open(
-            os.path.join(
-                os.path.dirname(os.path.realpath(__file__)),
-                r"pickles",
-                "abbr_dict",
-            ),
-            "rb",
-        )
-    )
-    abbr_pattern = pickle.load(
-        open(
-            os.path.join(
-                os.path.dirname(os.path.realpath(__file__)),
-                r"pickles",
-                "abbr_pattern",
-            ),
-            "rb",
-        )
-    )
-    texts = [
-        abbr_pattern.sub(lambda x: abbr_dict[x.group()], text)
-        for text in texts
-    ]
+    abbr_dict = resources.get("abbr_dict")
+    abbr_pattern = resources.get("abbr_pattern")
+    texts = [_force_abbr_text(text, abbr_dict, abbr_pattern) for text in texts]
 
     if strBOOL:
         return texts[0]
     return texts
 
 
+def _force_abbr_text(text, abbr_dict, abbr_pattern):
+    return abbr_pattern.sub(lambda x: abbr_dict[x.group()], text)
+
+
 def force_number(texts, keep=True):
-    texts = copy(texts)
     strBOOL = False
     if isinstance(texts, str):
         texts = [texts]
         strBOOL = True
+    else:
+        texts = list(texts)
 
     texts = [
         re.sub(
@@ -160,22 +488,14 @@ def force_number(texts, keep=True):
 
 
 def force_sw(texts, keep=True):
-    texts = copy(texts)
     strBOOL = False
     if isinstance(texts, str):
         texts = [texts]
         strBOOL = True
+    else:
+        texts = list(texts)
 
-    stopwords = pickle.load(
-        open(
-            os.path.join(
-                os.path.dirname(os.path.realpath(__file__)),
-                "pickles",
-                "stopwords",
-            ),
-            "rb",
-        )
-    )
+    stopwords = resources.get("stopwords")
 
     texts = [
         re.sub(
@@ -195,99 +515,121 @@ def force_sw(texts, keep=True):
     return texts
 
 
-def force_demographic(texts, keep=True):
-    texts = copy(texts)
+def force_demographic(texts, keep=True, return_spans=False):
+    """
+    mask dates, times, US addresses and phone numbers
+    @param texts: string or list of strings
+    @param keep: if true replace non-whitespace characters in each finding
+        with "X" (length preserving), else remove the finding
+    @param return_spans: if true return (text, spans) per text where spans
+        is a list of (category, start, end) offsets into the input text
+    NOTE: dates, phones and times are found by one combined scanner, then
+        addresses by pyap; overlapping findings keep the address, else the
+        earlier finding
+    """
     strBOOL = False
     if isinstance(texts, str):
         texts = [texts]
         strBOOL = True
+    else:
+        texts = list(texts)
 
-    # find all dates
-    re_date = r"(\b\d{4}[-]\d{1,2}[-]\d{1,2}\b|\b\d{1,2}[-]\d{1,2}[-]\d{4}\b|"\
-        r"\b\d{1,2}[-]\d{1,2}[-]\d{2}\b|\b\d{4}[\.]\d{1,2}[\.]\d{1,2}\b|\b\d"\
-        r"{1,2}[\.]\d{1,2}[\.]\d{4}\b|\b\d{1,2}[\.]\d{1,2}[\.]\d{2}\b|\b\d{4}"\
-        r"[/]\d{1,2}[/]\d{1,2}\b|\b\d{1,2}[/]\d{1,2}[/]\d{4}\b|\b\d{1,2}[/]\d"\
-        r"{1,2}[/]\d{2}\b)|((\b\d{1,2}\D{0,3})?\b(?:(J|j)an(?:uary)?|(F|f)eb"\
-        r"(?:ruary)?|(M|m)ar(?:ch)?|(A|a)pr(?:il)?|(M|m)ay|(J|j)un(?:e)?|(J|"\
-        r"j)ul(?:y)?|(A|a)ug(?:ust)?|(S|s)ep?(?:tember)?|(O|o)ct(?:ober)?|(("\
-        r"N|n)ov|(D|d)ec)(?:ember)?)\D{1,2}(\d{1,2}(st|nd|th)?\D?)?\D?(\d{4}))"
-    for i in range(len(texts)):
-        if keep:
-            date_list = [
-                (d.start(), d.end())
-                for d in re.finditer(re_date, texts[i], flags=re.IGNORECASE)
-            ]
-            for start, end in zip(date_list):
-                texts[i] = (
-                    texts[i][:start]
-                    + re.sub(r"\S", "X", texts[i][start:end])
-                    + texts[i][end:]
-                )
-        else:
-            texts[i] = re.sub(re_date, "", texts[i], flags=re.IGNORECASE)
-
-    # find all times
-    re_time = r"(([0]?[1-9]|1[0-2])((\:|\.)[0-5][0-9]){1,2}( )?(am|pm))|(([0]"\
-        r"?[0-9]|1[0-9]|2[0-3])((\:|\.)[0-5][0-9]){1,2})"
     for i in range(len(texts)):
-        if keep:
-            time_list = [
-                (t.start(), t.end())
-                for t in re.finditer(re_time, texts[i], flags=re.IGNORECASE)
-            ]
-            for start, end in zip(time_list):
-                texts[i] = (
-                    texts[i][:start]
-                    + re.sub(r"\S", "X", texts[i][start:end])
-                    + texts[i][end:]
-                )
-        else:
-            texts[i] = re.sub(re_time, "", texts[i], flags=re.IGNORECASE)
-
-    # find all address
-    for i in range(len(texts)):
-        addr_list = [str(j) for j in pyap.parse(texts[i], country="US")]
-        for addr in addr_list:
-            if keep:
-                addr_match = re.search(re.escape(addr), texts[i])
-                start, end = addr_match.start(), addr_match.end()
-                texts[i] = (
-                    texts[i][:start]
-                    + re.sub(r"\S", "X", texts[i][start:end])
-                    + texts[i][start:]
-                )
-            else:
-                texts[i] = re.sub(re.escape(addr), "", texts[i])
-
-    # find all phone numbers
-    for i in range(len(texts)):
-        re_phone = re.compile(
-            r"(\+\d{1,2}\s)?\(?\d{3}\)?[\s.-]\d{3}[\s.-]\d{4}"
-        )
-        if keep:
-            phone_list = [
-                (t.start(), t.end()) for t in re.finditer(re_phone, texts[i])
-            ]
-            for start, end in zip(phone_list):
-                texts[i] = (
-                    texts[i][:start]
-                    + re.sub(r"\S", "X", texts[i][start:end])
-                    + texts[i][end:]
-                )
-        else:
-            texts[i] = re.sub(re_phone, "", texts[i])
+        spans = _demographic_spans(texts[i])
+        masked = _mask_spans(texts[i], spans, keep)
+        texts[i] = (masked, spans) if return_spans else masked
 
     if strBOOL:
         return texts[0]
     return texts
 
 
+# precompiled for force_demographic
+_RE_DATE = r"(\b\d{4}[-]\d{1,2}[-]\d{1,2}\b|\b\d{1,2}[-]\d{1,2}[-]\d{4}\b|"\
+    r"\b\d{1,2}[-]\d{1,2}[-]\d{2}\b|\b\d{4}[\.]\d{1,2}[\.]\d{1,2}\b|\b\d"\
+    r"{1,2}[\.]\d{1,2}[\.]\d{4}\b|\b\d{1,2}[\.]\d{1,2}[\.]\d{2}\b|\b\d{4}"\
+    r"[/]\d{1,2}[/]\d{1,2}\b|\b\d{1,2}[/]\d{1,2}[/]\d{4}\b|\b\d{1,2}[/]\d"\
+    r"{1,2}[/]\d{2}\b)|((\b\d{1,2}\D{0,3})?\b(?:(J|j)an(?:uary)?|(F|f)eb"\
+    r"(?:ruary)?|(M|m)ar(?:ch)?|(A|a)pr(?:il)?|(M|m)ay|(J|j)un(?:e)?|(J|"\
+    r"j)ul(?:y)?|(A|a)ug(?:ust)?|(S|s)ep?(?:tember)?|(O|o)ct(?:ober)?|(("\
+    r"N|n)ov|(D|d)ec)(?:ember)?)\D{1,2}(\d{1,2}(st|nd|th)?\D?)?\D?(\d{4}))"
+_RE_TIME = r"(([0]?[1-9]|1[0-2])((\:|\.)[0-5][0-9]){1,2}( )?(am|pm))|(([0]"\
+    r"?[0-9]|1[0-9]|2[0-3])((\:|\.)[0-5][0-9]){1,2})"
+_RE_PHONE = r"(\+\d{1,2}\s)?\(?\d{3}\)?[\s.-]\d{3}[\s.-]\d{4}"
+
+# phones before times so the time pattern cannot split a phone number
+_RE_DEMOGRAPHIC = re.compile(
+    "(?P<date>" + _RE_DATE + ")|(?P<phone>" + _RE_PHONE + ")|(?P<time>"
+    + _RE_TIME + ")",
+    flags=re.IGNORECASE,
+)
+_RE_DIGIT = re.compile(r"\d")
+_RE_NONSPACE = re.compile(r"\S")
+
+
+def _demographic_spans(text):
+    # every category needs a digit, skip the scanners otherwise
+    if not _RE_DIGIT.search(text):
+        return []
+
+    # addresses
+    addresses = []
+    cursor = 0
+    for addr in pyap.parse(text, country="US"):
+        start = getattr(addr, "match_start", None)
+        if start is None:
+            start = text.find(str(addr), cursor)
+            if start == -1:
+                continue
+            end = start + len(str(addr))
+        else:
+            end = addr.match_end
+        addresses.append(("address", start, end))
+        cursor = end
+    addresses.sort(key=lambda x: x[1])
+
+    # dates, phones and times in one scan, sans those inside an address
+    spans = []
+    starts = [i[1] for i in addresses]
+    for m in _RE_DEMOGRAPHIC.finditer(text):
+        j = bisect_right(starts, m.start()) - 1
+        if j >= 0 and addresses[j][2] > m.start():
+            continue
+        if j + 1 < len(starts) and starts[j + 1] < m.end():
+            continue
+        spans.append((m.lastgroup, m.start(), m.end()))
+
+    # merge by start, dropping any remaining overlap
+    output = []
+    for span in sorted(spans + addresses, key=lambda x: x[1]):
+        if output and span[1] < output[-1][2]:
+            continue
+        output.append(span)
+    return output
+
+
+def _mask_spans(text, spans, keep):
+    # X-out (keep) or drop sorted, disjoint spans with a single string build
+    if not spans:
+        return text
+    pieces = []
+    prev = 0
+    for _, start, end in spans:
+        pieces.append(text[prev:start])
+        if keep:
+            pieces.append(_RE_NONSPACE.sub("X", text[start:end]))
+        prev = end
+    pieces.append(text[prev:])
+    return "".join(pieces)
+
+
 def split_into_sentence(texts, chaining=False):
-    texts = copy(texts)
     strBOOL = False
     if isinstance(texts, str):
         texts = [texts]
         strBOOL = True
+    else:
+        texts = list(texts)
 
     texts = [
         re.split(
@@ -309,11 +651,12 @@ def strip_line_returns(texts):
     return: text without in-par line returns
     WHY: parsed PDFs have line returns at the end of every line
     """
-    texts = copy(texts)
     strBOOL = False
     if isinstance(texts, str):
         texts = [texts]
         strBOOL = True
+    else:
+        texts = list(texts)
 
     # precompile and perform
     re_LR = re.compile(
@@ -332,11 +675,12 @@ def strip_parenthesized(texts):
     @param text: string
     return: text without parenthesized text
     """
-    texts = copy(texts)
     strBOOL = False
     if isinstance(texts, str):
         texts = [texts]
         strBOOL = True
+    else:
+        texts = list(texts)
 
     # precompile and perform
     re_parenthesized = re.compile(r"\(.*\)")
@@ -348,131 +692,251 @@ def strip_parenthesized(texts):
     return texts
 
 
-def remove_false_periods(texts):
+def remove_false_periods(texts, return_offsets=False):
     """
     @param texts: string or list of strings
+    @param return_offsets: if true return (text, offsets) per text where
+        offsets[i] is the index in the input of character i of the output
+        (with len(input) appended), to project spans back to the input
     return: strings without false periods (e.g. etc. and so on)
     """
-    texts = copy(texts)
     strBOOL = False
     if isinstance(texts, str):
         texts = [texts]
         strBOOL = True
+    else:
+        texts = list(texts)
 
-    # precompile and perform
-    re_acronym = re.compile(r"(?<=\.[a-zA-Z])\.")
-    re_periods = re.compile(r"\.\s*[a-zA-Z]")
-    prefixes = [
-        "amb", "bgen", "brigen", "capt", "col", "dr", "gen", "gov", "hon",
-        "inc", "jr", "lieut", "lt", "maj", "mdme", "mr", "mrs", "ms", "msgr",
-        "messrs", "no", "prof", "rep", "rev", "sen", "sgt", "sr"
-    ] + list("abcdefghijklmnopqrstuvwxyz")
     for i in range(len(texts)):
-        texts[i] = re.sub(re_acronym, r"", texts[i])
-        locs = [m.start() for m in re.finditer(re_periods, texts[i])]
-        for j in range(len(locs) - 1, -1, -1):
-            if (
-                locs[j] - 1 != -1
-                and texts[i][locs[j] - 1].isalpha()
-                and text_tools.words.prevword(texts[i], locs[j]).lower()
-                in prefixes
-            ):
-                texts[i] = texts[i][: locs[j]] + texts[i][locs[j] + 1 :]
+        if return_offsets:
+            texts[i] = _remove_false_periods_offsets(texts[i])
+        else:
+            texts[i] = _remove_false_periods_text(texts[i])
 
     if strBOOL == True:
         return texts[0]
     return texts
 
 
-def drop_negex(texts, comma_delimit=False):
+# precompiled for remove_false_periods
+_RE_ACRONYM = re.compile(r"(?<=\.[a-zA-Z])\.")
+_RE_PERIODS = re.compile(r"\.\s*[a-zA-Z]")
+_FALSE_PERIOD_PREFIXES = frozenset(
+    [
+        "amb", "bgen", "brigen", "capt", "col", "dr", "gen", "gov", "hon",
+        "inc", "jr", "lieut", "lt", "maj", "mdme", "mr", "mrs", "ms", "msgr",
+        "messrs", "no", "prof", "rep", "rev", "sen", "sgt", "sr"
+    ]
+    + list("abcdefghijklmnopqrstuvwxyz")
+)
+_FALSE_PERIOD_MAXLEN = max(len(i) for i in _FALSE_PERIOD_PREFIXES)
+
+
+def _remove_false_periods_text(text):
+    if "." not in text:
+        return text
+    text = _RE_ACRONYM.sub(r"", text)
+    locs = _false_period_locs(text)
+    if not locs:
+        return text
+    return "".join(
+        [text[s + 1 : e] for s, e in zip([-1] + locs, locs + [len(text)])]
+    )
+
+
+def _false_period_locs(text):
+    """
+    return: indices of periods that directly follow a prefix word
+    NOTE: the alpha run before each candidate is walked back at most one
+        character past the longest prefix, so each candidate is O(1)
+    """
+    locs = []
+    for m in _RE_PERIODS.finditer(text):
+        loc = m.start()
+        start = loc
+        while (
+            start > 0
+            and loc - start <= _FALSE_PERIOD_MAXLEN
+            and text[start - 1].isalpha()
+        ):
+            start -= 1
+        if (
+            start < loc
+            and loc - start <= _FALSE_PERIOD_MAXLEN
+            and text[start:loc].lower() in _FALSE_PERIOD_PREFIXES
+        ):
+            locs.append(loc)
+    return locs
+
+
+def _remove_false_periods_offsets(text):
+    # same as _remove_false_periods_text, also mapping output to input index
+    acronyms = [m.start() for m in _RE_ACRONYM.finditer(text)]
+    stripped = _RE_ACRONYM.sub(r"", text) if acronyms else text
+
+    # project false periods of the stripped text back to the input
+    removed = set(acronyms)
+    k = 0
+    for loc in _false_period_locs(stripped):
+        while k < len(acronyms) and acronyms[k] <= loc + k:
+            k += 1
+        removed.add(loc + k)
+    offsets = [i for i in range(len(text)) if i not in removed]
+    offsets.append(len(text))
+    return "".join([text[i] for i in offsets[:-1]]), offsets
+
+
+def drop_negex(texts, comma_delimit=False, return_spans=False):
     """
     @param text: text string
-    @param n: if None, remove until sentance ending punct, else # of words max
+    @param comma_delimit: commas also end a negated phrase
+    @param return_spans: if true return the negated (start, end) offsets of
+        each text instead of the uppercased text
     return: text with all negated phrases replaced with capped terms (not
         detected by pipeline but still visible)
     NOTE: see negex.txt for items used
     """
     # load all locations
-    punct = "!()+.;:?\n\t\r\f\-\\/"  # comma was removed from delimit list
+    re_punct = _RE_NEGEX_PUNCT
     if comma_delimit:
-        punct = punct + ","
-    with open(
-        os.path.join(
-            os.path.dirname(os.path.realpath(__file__)), "pickles", "negex"
-        ),
-        "rb",
-    ) as fp:
-        negex = pickle.load(fp)
-        negex_false = pickle.load(fp)
-        negex_pre = pickle.load(fp)
+        re_punct = re.compile("[" + re.escape(_NEGEX_PUNCT + ",") + "]")
+    patterns = resources.get("negex")
 
     strBOOL = False
     if isinstance(texts, str):
         texts = [texts]
         strBOOL = True
+    else:
+        texts = list(texts)
+
+    # spans only, text untouched
+    if return_spans:
+        spans = [_negex_spans(text, re_punct, patterns) for text in texts]
+        if strBOOL:
+            return spans[0]
+        return spans
 
     # for each text
     for i in range(len(texts)):
-        textlength = len(texts[i])
-
-        # find all locations sans false locations
-        locs = [[m.start(), m.group()] for m in re.finditer(negex, texts[i])]
-        locs_false = [m.start() for m in re.finditer(negex_false, texts[i])]
-        locs = [m for m in locs if m[0] not in locs_false]
-        locs.sort(reverse=True)
-
-        # negex post
-        for m in locs:
-            idx = m[0] + len(m[1])
-            while idx < textlength and texts[i][idx] not in punct:
-                idx += 1
-            texts[i] = (
-                texts[i][0 : m[0]]
-                + texts[i][m[0] : idx].upper()
-                + texts[i][idx:textlength]
-            )
-
-        # negex pre
-        locs_pre = [
-            [m.end(), m.group()] for m in re.finditer(negex_pre, texts[i])
-        ]
-        locs_pre.sort(reverse=True)
-        for m in locs_pre:
-            idx = m[0] - len(m[1])
-            while idx > 0 and texts[i][idx] not in punct:
-                idx -= 1
-            texts[i] = (
-                texts[i][0:idx]
-                + texts[i][idx : m[0]].upper()
-                + texts[i][m[0] : textlength]
-            )
+        texts[i] = _drop_negex_text(texts[i], re_punct, patterns)
 
     if strBOOL == True:
         return texts[0]
     return texts
 
 
+# comma was removed from delimit list
+_NEGEX_PUNCT = "!()+.;:?\n\t\r\f\-\\/"
+_RE_NEGEX_PUNCT = re.compile("[" + re.escape(_NEGEX_PUNCT) + "]")
+
+
+def _drop_negex_text(text, re_punct, patterns):
+    spans = _negex_spans(text, re_punct, patterns)
+    if not spans:
+        return text
+    return _upper_spans(text, spans)
+
+
+def _negex_spans(text, re_punct, patterns):
+    """
+    return: merged (start, end) offsets of negated phrases in text
+    NOTE: post-negation runs from the trigger to the next delimiter and
+        pre-negation from the previous delimiter to the trigger; pre
+        triggers are searched with the post phrases already uppercased
+    """
+    negex, negex_false, negex_pre = patterns
+    textlength = len(text)
+    bounds = None
+
+    # negex post, sans triggers at false locations
+    spans = []
+    locs = [(m.start(), m.end()) for m in negex.finditer(text)]
+    if locs:
+        locs_false = set(m.start() for m in negex_false.finditer(text))
+        bounds = [m.start() for m in re_punct.finditer(text)]
+        for start, end in locs:
+            if start in locs_false:
+                continue
+            j = bisect_left(bounds, end)
+            end = bounds[j] if j < len(bounds) else textlength
+            spans.append((start, end))
+        spans = _merge_spans(spans)
+
+    # negex pre, scanned at the same offsets as text
+    scanned = _upper_spans(text, spans, same_length=True) if spans else text
+    locs_pre = [(m.start(), m.end()) for m in negex_pre.finditer(scanned)]
+    if locs_pre:
+        if bounds is None:
+            bounds = [m.start() for m in re_punct.finditer(text)]
+        for start, end in locs_pre:
+            j = bisect_right(bounds, start) - 1
+            spans.append((bounds[j] if j >= 0 else 0, end))
+        spans = _merge_spans(spans)
+    return spans
+
+
+def _merge_spans(spans):
+    # sort and merge overlapping or touching (start, end) spans
+    spans = sorted(spans)
+    merged = []
+    for start, end in spans:
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _upper_spans(text, spans, same_length=False):
+    # uppercase sorted, disjoint spans with a single string build; with
+    # same_length, characters whose uppercase is longer (e.g. "ß" -> "SS")
+    # are left as they are so offsets into text stay valid
+    pieces = []
+    prev = 0
+    for start, end in spans:
+        pieces.append(text[prev:start])
+        piece = text[start:end]
+        upper = piece.upper()
+        if same_length and len(upper) != len(piece):
+            upper = "".join(
+                [i.upper() if len(i.upper()) == 1 else i for i in piece]
+            )
+        pieces.append(upper)
+        prev = end
+    pieces.append(text[prev:])
+    return "".join(pieces)
+
+
 def stem_all(texts):
-    texts = copy(texts)
     strBOOL = False
     if isinstance(texts, str):
         texts = [texts]
         strBOOL = True
+    else:
+        texts = list(texts)
 
-    # tokenize and stem if alpha >= 3 chars
-    re_splits = re.compile(r"\w+|\W+")
     for i in range(len(texts)):
-        tokens = re.findall(re_splits, texts[i])
-        for j in range(len(tokens)):
-            if len(tokens[j]) >= 3 and tokens[j].isalpha():
-                tokens[j] = stem(tokens[j])
-        texts[i] = "".join(tokens)
+        texts[i] = _stem_text(texts[i])
 
     if strBOOL == True:
         return texts[0]
     return texts
 
 
+_RE_SPLITS = re.compile(r"\w+|\W+")
+
+
+def _stem_text(text):
+    # tokenize and stem if alpha >= 3 chars
+    stem = stems.cache.stem
+    tokens = _RE_SPLITS.findall(text)
+    for j in range(len(tokens)):
+        if len(tokens[j]) >= 3 and tokens[j].isalpha():
+            tokens[j] = stem(tokens[j])
+    return "".join(tokens)
+
+
 def stem_map(doc, doc_stemmed=None):
     """
     @param doc: original document
@@ -539,6 +1003,8 @@ def GGK_preprocessor(texts):
     if isinstance(texts, str):
         texts = [texts]
         strBOOL = True
+    else:
+        texts = list(texts)
 
     # precompile and perform
     for i in range(len(texts)):
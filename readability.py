@@ -7,13 +7,11 @@
 # Created:  09.01.2015
 ###############################################################################
 
-import os
 import re
-import pickle
 import numpy as np
 from copy import copy
 from langdetect import detect
-from text_tools import vectorizer
+from text_tools import resources, vectorizer
 
 
 def check_by_vocab(text, vocab, min_tokens=10):
@@ -43,22 +41,14 @@ def check_by_trigrams(doc, minimum=False):
     text = copy(doc)
     if not text:
         return 1.0
-    classifier = pickle.load(
-        open(
-            os.path.join(
-                os.path.dirname(os.path.realpath(__file__)),
-                r"pickles",
-                "readability_classifier_trigram",
-            ),
-            "rb",
-        )
-    )
+    classifier = resources.get("readability_classifier_trigram")
     if isinstance(text, list):
         results = classifier.predict_proba(vectorizer.trif_vectorizer(text))[
             :, 1
         ]
 
-        # empty string case returns 1
+        # empty string case returns 1 (empty once reduced to trigram text)
+        text = [vectorizer.trigram_text(i) for i in text]
         if minimum:
             return np.min(
                 [
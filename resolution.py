@@ -24,22 +24,22 @@ def fetch_capped_chains(text):
         for i in re.finditer(r"\b[A-Z][a-zA-Z]+\b", text)
         if i.group().lower() not in ENGLISH_STOP_WORDS
     ]
-    for i in range(len(locs) - 1, -1, -1):
-        if words.prevwordindex(text, locs[i]) in locs:
-            del locs[i]
+    index = words.TokenIndex(text, alpha=True)
+    starts = set(locs)
+    locs = [i for i in locs if index.prevwordindex(i) not in starts]
 
     # append new words
     output = set()
     for i in range(len(locs)):
-        phrase = words.fullword(text, locs[i])
-        locs[i] = words.nextwordindex(text, locs[i])
+        phrase = index.fullword(locs[i])
+        locs[i] = index.nextwordindex(locs[i])
         while (
             locs[i] != None
             and text[locs[i]].isupper()
-            and words.fullword(text, locs[i]).lower() not in ENGLISH_STOP_WORDS
+            and index.fullword(locs[i]).lower() not in ENGLISH_STOP_WORDS
         ):
-            phrase = phrase + r" " + words.fullword(text, locs[i])
-            locs[i] = words.nextwordindex(text, locs[i])
+            phrase = phrase + r" " + index.fullword(locs[i])
+            locs[i] = index.nextwordindex(locs[i])
         output.add(phrase)
     output = list(output)
     output.sort()
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+###############################################################################
+# MODULE: resources
+# process-wide registry of the lexicons pickled in pickles/
+# each artifact is unpickled once per process on first use and shared by every
+# module afterwards. custom lexicons can be swapped in with override().
+###############################################################################
+
+import os
+import pickle
+import hashlib
+import threading
+from collections import Counter
+
+PICKLE_DIR = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), "pickles"
+)
+
+_lock = threading.RLock()
+_registry = {}
+_overrides = {}
+_load_counts = Counter()
+
+
+def get(name):
+    """
+    return: the lexicon stored under pickles/<name>, loaded once per process
+    @param name: artifact name (e.g. 'charmap', 'abbr_dict', 'negex')
+    NOTE: files holding several consecutive pickles return a tuple
+    """
+    # fast path without the lock once populated
+    try:
+        return _registry[name]
+    except KeyError:
+        pass
+
+    with _lock:
+        if name not in _registry:
+            if name in _overrides:
+                _registry[name] = _overrides[name]
+            else:
+                _registry[name] = _load(name)
+                _load_counts[name] += 1
+        return _registry[name]
+
+
+def override(name, value):
+    """
+    replace a lexicon for the rest of the process (custom lexicons)
+    @param name: artifact name
+    @param value: object to serve in place of pickles/<name>
+    """
+    with _lock:
+        _overrides[name] = value
+        _registry[name] = value
+
+
+def reload(name=None):
+    """
+    drop cached lexicons and overrides so they are re-read on next use
+    @param name: artifact name, or None to reload everything
+    """
+    with _lock:
+        if name is None:
+            _registry.clear()
+            _overrides.clear()
+        else:
+            _registry.pop(name, None)
+            _overrides.pop(name, None)
+
+
+def load_counts():
+    """
+    return: dict of artifact name -> number of times it was unpickled
+    """
+    with _lock:
+        return dict(_load_counts)
+
+
+def fingerprint(names):
+    """
+    return: hex digest identifying the current version of the named lexicons
+    @param names: artifact names
+    NOTE: lexicons on disk hash their file, overrides their pickled value
+    """
+    digest = hashlib.sha1()
+    with _lock:
+        for name in sorted(set(names)):
+            digest.update(name.encode("utf-8"))
+            if name in _overrides:
+                digest.update(pickle.dumps(_overrides[name], protocol=2))
+            else:
+                with open(os.path.join(PICKLE_DIR, name), "rb") as fp:
+                    digest.update(fp.read())
+    return digest.hexdigest()
+
+
+def _load(name):
+    objs = []
+    with open(os.path.join(PICKLE_DIR, name), "rb") as fp:
+        while True:
+            try:
+                objs.append(pickle.load(fp))
+            except EOFError:
+                break
+    if len(objs) == 1:
+        return objs[0]
+    return tuple(objs)
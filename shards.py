@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+###############################################################################
+# MODULE: shards
+# out-of-core vectorization: stream documents through a Vectorizer into CSR
+# shards on disk (indices/indptr/data .npy files, memory-mappable), and read
+# them back as one lazily-loaded matrix for training and scoring.
+###############################################################################
+
+import os
+import json
+import scipy
+import numpy as np
+from itertools import islice
+from text_tools import vectorizer
+
+MANIFEST = "shards.json"
+
+
+def write_shards(texts, vocab, path, shard_size=10000, pool=None):
+    """
+    vectorize an iterable of documents shard by shard, never holding more
+    than shard_size texts or one shard matrix in memory
+    @param texts: iterable of preprocessed strings, consumed lazily
+    @param vocab: a list of vocab, or a Vectorizer (e.g. HashingVectorizer)
+    @param path: directory for the shards, created if missing
+    @param shard_size: texts per shard
+    @param pool: a VectorizerPool on the same vectorizer, to transform each
+        shard in parallel
+    return: ShardedMatrix over the written shards
+    """
+    assert shard_size > 0, "Error: shard_size must be positive. Aborting."
+    if not isinstance(vocab, vectorizer.Vectorizer):
+        vocab = vectorizer.Vectorizer(vocab)
+    if not os.path.isdir(path):
+        os.makedirs(path)
+
+    texts = iter(texts)
+    shards = []
+    while True:
+        batch = list(islice(texts, shard_size))
+        if not batch:
+            break
+        if pool is not None:
+            matrix = pool.transform(batch)
+        else:
+            matrix = vocab.transform(batch)
+        name = "%05d" % len(shards)
+        for part in ("indices", "indptr", "data"):
+            np.save(
+                os.path.join(path, "%s.%s.npy" % (name, part)),
+                getattr(matrix, part),
+            )
+        shards.append({"name": name, "rows": matrix.shape[0]})
+
+        # manifest after every shard, so a partial run is still readable
+        _write_manifest(path, shards, len(vocab), matrix.dtype)
+    if not shards:
+        _write_manifest(path, shards, len(vocab), np.dtype(vocab.dtype))
+    return ShardedMatrix(path)
+
+
+def _write_manifest(path, shards, n_cols, dtype):
+    temp = os.path.join(path, MANIFEST + ".tmp")
+    with open(temp, "w") as fp:
+        json.dump(
+            {"n_cols": n_cols, "dtype": np.dtype(dtype).str, "shards": shards},
+            fp,
+        )
+    os.replace(temp, os.path.join(path, MANIFEST))
+
+
+class ShardedMatrix(object):
+    """
+    read-only view of shards written by write_shards, presented as one
+    (rows x columns) sparse matrix; shards are memory-mapped on access
+    @param path: directory holding the shards and their manifest
+    @param mmap: memory-map the .npy files rather than reading them
+    NOTE: iterate shards() to train (e.g. partial_fit) or score without
+        loading the whole matrix; tocsr() materializes everything
+    """
+
+    def __init__(self, path, mmap=True):
+        with open(os.path.join(path, MANIFEST), "r") as fp:
+            manifest = json.load(fp)
+        self.path = path
+        self.mmap_mode = "r" if mmap else None
+        self.dtype = np.dtype(manifest["dtype"])
+        self.names = [i["name"] for i in manifest["shards"]]
+        self.offsets = np.concatenate(
+            ([0], np.cumsum([i["rows"] for i in manifest["shards"]]))
+        ).astype(np.int64)
+        self.shape = (int(self.offsets[-1]), manifest["n_cols"])
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __iter__(self):
+        return self.shards()
+
+    def __getitem__(self, key):
+        """
+        @param key: row number or slice of rows (step 1)
+        return: csr matrix of the rows, loading only the shards they span
+        """
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.shape[0])
+            assert step == 1, "Error: row slices must be contiguous. Aborting."
+            return self._rows(start, max(start, stop))
+        if key < 0:
+            key += self.shape[0]
+        if not 0 <= key < self.shape[0]:
+            raise IndexError("row %d out of range" % key)
+        return self._rows(key, key + 1)
+
+    @property
+    def n_shards(self):
+        return len(self.names)
+
+    def shard(self, i):
+        """
+        return: csr matrix of the ith shard, backed by the memory-mapped files
+        """
+        name = os.path.join(self.path, self.names[i])
+        data, indices, indptr = [
+            np.load("%s.%s.npy" % (name, part), mmap_mode=self.mmap_mode)
+            for part in ("data", "indices", "indptr")
+        ]
+        return scipy.sparse.csr_matrix(
+            (data, indices, indptr),
+            shape=(len(indptr) - 1, self.shape[1]),
+            copy=False,
+        )
+
+    def shards(self):
+        """
+        return: generator of the shard matrices in row order
+        """
+        for i in range(self.n_shards):
+            yield self.shard(i)
+
+    def tocsr(self):
+        """
+        return: the whole matrix in memory
+        """
+        return self._rows(0, self.shape[0])
+
+    def _rows(self, start, stop):
+        first = int(np.searchsorted(self.offsets, start, side="right")) - 1
+        output = []
+        for i in range(max(first, 0), self.n_shards):
+            if self.offsets[i] >= stop:
+                break
+            output.append(
+                self.shard(i)[
+                    max(start - self.offsets[i], 0) : stop - self.offsets[i]
+                ]
+            )
+        if not output:
+            return scipy.sparse.csr_matrix(
+                (0, self.shape[1]), dtype=self.dtype
+            )
+        return scipy.sparse.vstack(output, format="csr")
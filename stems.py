@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+###############################################################################
+# MODULE: stems
+# memoized porter2 stemming shared by preprocessing and vocab_tools
+# corpora are zipfian so a few thousand types cover most tokens; once warm,
+# stemming is a dictionary lookup.
+###############################################################################
+
+import os
+import pickle
+from stemming.porter2 import stem as porter2_stem
+
+
+class StemCache(object):
+    """
+    size-capped memo of porter2 stems with hit/miss statistics
+    @param maxsize: maximum number of cached types, oldest evicted first
+    """
+
+    def __init__(self, maxsize=2 ** 18):
+        assert maxsize > 0, "Error: maxsize must be greater than 0. Aborting."
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._stems = {}
+
+    def __len__(self):
+        return len(self._stems)
+
+    def __contains__(self, word):
+        return word in self._stems
+
+    def stem(self, word):
+        """
+        return: porter2 stem of word, cached
+        """
+        try:
+            result = self._stems[word]
+        except KeyError:
+            self.misses += 1
+            result = porter2_stem(word)
+            if len(self._stems) >= self.maxsize:
+                self._stems.pop(next(iter(self._stems)), None)
+            self._stems[word] = result
+            return result
+        self.hits += 1
+        return result
+
+    def warm(self, words):
+        """
+        pre-populate the cache
+        @param words: iterable of words or path to a line-return separated
+            vocabulary file
+        """
+        if isinstance(words, str) and os.path.isfile(words):
+            with open(words, "r", encoding="utf-8") as fp:
+                words = fp.read().split()
+        for word in words:
+            if word not in self._stems:
+                self.stem(word)
+
+    def stats(self):
+        """
+        return: dict of hits, misses, hit rate, size and maxsize
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / float(total) if total else 0.0,
+            "size": len(self._stems),
+            "maxsize": self.maxsize,
+        }
+
+    def clear(self):
+        self._stems.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def save(self, path):
+        """
+        persist the cached stems to path
+        """
+        with open(path, "wb") as fp:
+            pickle.dump(dict(self._stems), fp)
+
+    def load(self, path):
+        """
+        merge stems persisted with save() into the cache
+        """
+        with open(path, "rb") as fp:
+            stems = pickle.load(fp)
+        for word, result in stems.items():
+            if len(self._stems) >= self.maxsize:
+                break
+            self._stems[word] = result
+
+
+# process-wide cache used by preprocessing.stem_all and vocab_tools
+cache = StemCache()
+
+
+def stem(word):
+    """
+    return: porter2 stem of word via the shared cache
+    """
+    return cache.stem(word)
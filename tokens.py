@@ -9,6 +9,173 @@
 # Created:  10.10.2015
 ###############################################################################
 
+import bisect
+import numpy as np
+
+PUNCT = "~|\\!*\"'()+,./`[]^;:{}<>?\n\t\r\f"
+
+
+class TokenIndex(object):
+    """
+    token boundaries of one text, built once and queried many times
+    @param text: str
+    @param alpha: tokens are runs of alphabetic characters (words) rather
+        than alphanumeric characters
+    NOTE: navigation stops at punctuation barriers (PUNCT), like the module
+        functions; lookups are O(log n) by bisection over the token starts
+    """
+
+    def __init__(self, text, alpha=False):
+        self.text = text
+        self.alpha = alpha
+        codes = np.frombuffer(
+            text.encode("utf-32-le", "surrogatepass"), dtype=np.uint32
+        )
+        ascii = codes < 128
+        ascii_codes = np.where(ascii, codes, 0)
+        token = (_ASCII_ALPHA if alpha else _ASCII_ALNUM)[ascii_codes]
+        test = str.isalpha if alpha else str.isalnum
+        for i in np.flatnonzero(~ascii).tolist():
+            token[i] = test(text[i])
+        edges = np.diff(token.astype(np.int8), prepend=0, append=0)
+        punct = _ASCII_PUNCT[ascii_codes] & ascii
+
+        self.starts = np.flatnonzero(edges == 1)
+        self.ends = np.flatnonzero(edges == -1)
+        self.barriers = np.flatnonzero(punct)
+        self._starts = self.starts.tolist()
+        self._ends = self.ends.tolist()
+        self._barriers = self.barriers.tolist()
+        self._punct = punct.tobytes()
+
+    def __len__(self):
+        return len(self._starts)
+
+    def token(self, index):
+        """
+        return: number of the token covering index, or -1 if none does
+        """
+        k = bisect.bisect_right(self._starts, index) - 1
+        if k >= 0 and index < self._ends[k]:
+            return k
+        return -1
+
+    def fullword(self, index):
+        """
+        return: the whole token covering index
+        """
+        if index is None:
+            return None
+        k = self.token(self._check(index))
+        if k < 0:
+            return None
+        return self.text[self._starts[k] : self._ends[k]]
+
+    def nextwordindex(self, index):
+        """
+        return: start of the token after index, or None past a barrier
+        """
+        if index is None:
+            return None
+        index = self._check(index)
+
+        # step to end of current token
+        k = self.token(index)
+        index = self._ends[k] if k >= 0 else index + 1
+        if index >= len(self.text) or self._punct[index]:
+            return None
+
+        # first token character at or after index, unless a barrier is first
+        k = bisect.bisect_right(self._starts, index) - 1
+        if k >= 0 and index < self._ends[k]:
+            start = index
+        elif k + 1 < len(self._starts):
+            start = self._starts[k + 1]
+        else:
+            return None
+        b = bisect.bisect_left(self._barriers, index)
+        if b < len(self._barriers) and self._barriers[b] < start:
+            return None
+        return start
+
+    def prevwordindex(self, index):
+        """
+        return: start of the token before index, or None past a barrier
+        """
+        if index is None:
+            return None
+        index = self._check(index)
+
+        # step before start of current token
+        k = self.token(index)
+        index = self._starts[k] - 1 if k >= 0 else index - 1
+        if index < 0 or self._punct[index]:
+            return None
+
+        # last token at or before index, unless a barrier is after it
+        k = bisect.bisect_right(self._starts, index) - 1
+        if k < 0:
+            return None
+        end = min(index, self._ends[k] - 1)
+        b = bisect.bisect_right(self._barriers, index) - 1
+        if b >= 0 and self._barriers[b] > end:
+            return None
+        return self._starts[k]
+
+    def nextword(self, index):
+        return self.fullword(self.nextwordindex(index))
+
+    def prevword(self, index):
+        return self.fullword(self.prevwordindex(index))
+
+    def wordstartindex(self, index):
+        """
+        return: the starting index of the token covering index
+        """
+        if index is None:
+            return None
+        k = self.token(self._check(index))
+        return self._starts[k] if k >= 0 else None
+
+    def wordendindex(self, index):
+        """
+        given : index as the start of a token
+        return: the ending index of a token
+        """
+        if index is None:
+            return None
+        index = self._check(index)
+        k = self.token(index)
+        if k >= 0:
+            return self._ends[k] - 1
+        return None if self._punct[index] else index
+
+    def _check(self, index):
+        if index < 0:
+            index += len(self.text)
+        if not 0 <= index < len(self.text):
+            raise IndexError("string index out of range")
+        return index
+
+
+_ASCII_ALPHA = np.array([chr(i).isalpha() for i in range(128)])
+_ASCII_ALNUM = np.array([chr(i).isalnum() for i in range(128)])
+_ASCII_PUNCT = np.array([chr(i) in PUNCT for i in range(128)])
+_LAST_INDEX = {}
+
+
+def token_index(text, alpha=False):
+    """
+    @param text: str
+    @param alpha: index words (alphabetic) rather than tokens (alphanumeric)
+    return: TokenIndex of text, reusing the last one built for the same text
+    """
+    last = _LAST_INDEX.get(alpha)
+    if last is None or not (last.text is text or last.text == text):
+        last = TokenIndex(text, alpha=alpha)
+        _LAST_INDEX[alpha] = last
+    return last
+
 
 def has_upper(text):
     for i in text:
@@ -25,77 +192,15 @@ def has_lower(text):
 
 
 def fullword(text, index):
-    textlen = len(text)
-    if index == None or not text[index].isalnum():
-        return None
-    start = index
-    end = index
-
-    # step backwards
-    while start - 1 > 0 and text[start - 1].isalnum():
-        start -= 1
-
-    # step forwards
-    while end + 1 < textlen and text[end + 1].isalnum():
-        end += 1
-    return text[start : end + 1]
+    return token_index(text).fullword(index)
 
 
 def nextwordindex(text, index):
-    textlen = len(text)
-    punct = "~|\\!*\"'()+,./`[]^;:{}<>?\n\t\r\f"
-    if index == None:
-        return None
-
-    # step to end of current word
-    if text[index].isalnum():
-        while index < textlen and text[index].isalnum():
-            index += 1
-    else:
-        index += 1
-    if index >= textlen or text[index] in punct:
-        return None
-
-    # step to start of next word
-    while index < textlen and text[index] not in punct:
-        if index >= textlen or text[index] in punct:
-            return None
-        if text[index].isalnum():
-            return index
-        index += 1
-    return None
+    return token_index(text).nextwordindex(index)
 
 
 def prevwordindex(text, index):
-    punct = "~|\\!*\"'()+,./`[]^;:{}<>?\n\t\r\f"
-    if index == None:
-        return None
-
-    # find start of current word
-    if text[index].isalnum():
-        while index >= 0 and text[index].isalnum():
-            index -= 1
-    else:
-        index -= 1
-    if index < 0 or text[index] in punct:
-        return None
-
-    # find end of previous word
-    while text[index] not in punct and not text[index].isalnum():
-        if index < 0 or text[index] in punct:
-            return None
-        index -= 1
-    if index < 0 or text[index] in punct:
-        return None
-
-    # find start of previous word
-    while index >= 0 and text[index].isalnum():
-        index -= 1
-        if index == -1:
-            return 0
-        if not text[index].isalnum():
-            return index + 1
-    return None
+    return token_index(text).prevwordindex(index)
 
 
 def nextword(text, index):
@@ -107,17 +212,7 @@ def prevword(text, index):
 
 
 def wordstartindex(text, index):
-    if index == None or not text[index].isalnum():
-        return None
-
-    # find start of previous word
-    while index >= 0 and text[index].isalnum():
-        index -= 1
-        if index == -1:
-            return 0
-        if not text[index].isalnum():
-            return index + 1
-    return None
+    return token_index(text).wordstartindex(index)
 
 
 def wordendindex(text, index):
@@ -125,18 +220,4 @@ def wordendindex(text, index):
     given : text, index as the start of a word
     return: the ending index of a word
     """
-    if index == None:
-        return None
-    textlen = len(text)
-    punct = "~|\\!*\"'()+,./`[]^;:{}<>?\n\t\r\f"
-
-    # step to end of current word
-    if text[index].isalnum():
-        while index < textlen and text[index].isalnum():
-            index += 1
-    else:
-        index += 1
-    index -= 1
-    if index >= textlen or text[index] in punct:
-        return None
-    return index
+    return token_index(text).wordendindex(index)
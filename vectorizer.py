@@ -1,170 +1,791 @@
 # -*- coding: utf-8 -*-
 
-import os
 import re
+import math
+import zlib
 import scipy
 import pickle
 import platform
 import numpy as np
+import text_tools.extraction
 import text_tools.vocab_tools
-from copy import copy
 from tqdm import tqdm
 from collections import Counter
-from itertools import islice, tee
+from itertools import chain
 from sklearn.preprocessing import normalize
 from multiprocessing import Pool, cpu_count
+from text_tools import resources
 
 
-def count_vectorizer(texts, vocab, regex=None):
+VECTORIZER_MODES = ("count", "binary", "tf", "l2")
+
+
+class Vectorizer(object):
+    """
+    vectorizer fitted on a vocab once and reused (sklearn-style transform)
+    @param vocab: a list of vocab
+    @param mode: 'count', 'binary', 'tf' (counts over total terms matched)
+        or 'l2' (counts over their l2 norm, as tf_vectorizer)
+    @param dtype: dtype of the output matrix
+    @param regex: regular expression if available, else built from vocab
+    NOTE: the vocab matcher is not pickled with the vectorizer, which keeps
+        saved files small and cheap to ship to workers; load() rebuilds it
+        right away, so the compile is paid at start-up, not on a transform
+    """
+
+    def __init__(self, vocab, mode="binary", dtype=np.float64, regex=None):
+        assert (
+            mode in VECTORIZER_MODES
+        ), "Error: mode must be one of %s. Aborting." % (VECTORIZER_MODES,)
+        self.vocab = list(vocab)
+        self.mode = mode
+        self.dtype = dtype
+        self.hashdict = {k: v for v, k in enumerate(self.vocab)}
+        self._regex = regex
+        self._custom_regex = regex is not None
+
+    def __len__(self):
+        return len(self.vocab)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if not self._custom_regex:
+            state["_regex"] = None
+        return state
+
+    @property
+    def regex(self):
+        if self._regex is None:
+            self._regex = text_tools.vocab_tools.vocab_regex(self.vocab)
+        return self._regex
+
+    def fit(self, texts=None, y=None):
+        # vocab is fixed at construction, present for sklearn pipelines
+        return self
+
+    def fit_transform(self, texts, y=None):
+        return self.transform(texts)
+
+    def transform(self, texts):
+        """
+        @param texts: a string, iterable of strings or extraction.WindowSet
+        return: sparse matrix (rows are texts, columns are vocab)
+        """
+        if isinstance(texts, str):
+            texts = [texts]
+        lengths, indices, data = self._rows(texts)
+        indptr = np.concatenate(([0], np.cumsum(lengths)))
+        return _build_csr(indptr, indices, data, len(self), self.dtype)
+
+    def transform_batches(self, texts, batch_size=1000):
+        """
+        @param texts: iterable of strings, consumed lazily
+        @param batch_size: texts per yielded matrix
+        return: generator of sparse matrices of at most batch_size rows
+        """
+        batch = []
+        for text in texts:
+            batch.append(text)
+            if len(batch) >= batch_size:
+                yield self.transform(batch)
+                batch = []
+        if batch:
+            yield self.transform(batch)
+
+    def save(self, path):
+        with open(path, "wb") as fp:
+            pickle.dump(self, fp)
+
+    @classmethod
+    def load(cls, path):
+        """
+        return: the saved vectorizer, with its vocab matcher rebuilt
+        """
+        with open(path, "rb") as fp:
+            vectorizer = pickle.load(fp)
+        vectorizer.regex  # recompile now rather than on the first transform
+        return vectorizer
+
+    def _rows(self, texts):
+        """
+        return: (terms per text, concatenated sorted column indices, values
+            or None when all ones)
+        """
+        if isinstance(texts, text_tools.extraction.WindowSet):
+            return self._window_rows(texts)
+        regex = self.regex
+        hashdict = self.hashdict
+        lengths = []
+        indices = []
+        data = []
+        for text in texts:
+            if self.mode == "binary":
+                cols = sorted(set([hashdict[m] for m in regex.findall(text)]))
+                lengths.append(len(cols))
+                indices.extend(cols)
+                continue
+            counts = Counter([hashdict[m] for m in regex.findall(text)])
+            cols = sorted(counts)
+            values = [counts[j] for j in cols]
+            if cols and self.mode == "tf":
+                values = np.array(values, dtype=np.float64)
+                values = values / float(np.sum(values))
+            elif cols and self.mode == "l2":
+                values = np.array(values, dtype=np.float64)
+                values = values / float(np.sqrt(np.sum(values ** 2)))
+            lengths.append(len(cols))
+            indices.extend(cols)
+            data.extend(values)
+        return (
+            np.asarray(lengths, dtype=np.int32),
+            np.asarray(indices, dtype=np.int32),
+            None if self.mode == "binary" else data,
+        )
+
+    def _window_rows(self, windows):
+        """
+        _rows of a WindowSet, matching each page once
+        NOTE: a page match lies in a window exactly as the window's own
+            match would, unless a match straddles the window's edges or the
+            window cuts a word; those windows are matched on their own text.
+            A custom regex may look past window edges, so it matches every
+            window on its own text.
+        """
+        if self._custom_regex:
+            return self._rows(list(windows))
+        regex = self.regex
+        hashdict = self.hashdict
+        rows = []
+        cols = []
+        for page in np.unique(windows.pages).tolist():
+            select = np.flatnonzero(windows.pages == page)
+            text = windows.texts[page]
+            starts = windows.starts[select]
+            ends = windows.ends[select]
+
+            # every match of the page, in order and non-overlapping
+            hits = [
+                (m.start(), m.end(), m.group(1)) for m in regex.finditer(text)
+            ]
+            hit_s = np.array([i[0] for i in hits], dtype=np.int64)
+            hit_e = np.array([i[1] for i in hits], dtype=np.int64)
+            hit_c = np.array([hashdict[i[2]] for i in hits], dtype=np.int64)
+
+            # matches lying wholly inside each window
+            lo = np.searchsorted(hit_s, starts, side="left")
+            hi = np.maximum(np.searchsorted(hit_e, ends, side="right"), lo)
+
+            # windows whose own matches could differ from the page's
+            redo = ~_clean_bounds(text, starts, ends)
+            if hits:
+                last = len(hits) - 1
+                redo |= (lo > 0) & (hit_e[np.maximum(lo - 1, 0)] > starts)
+                redo |= (hi <= last) & (hit_s[np.minimum(hi, last)] < ends)
+
+            # attribute page matches to the other windows
+            counts = np.where(redo, 0, hi - lo)
+            first = np.repeat(lo - np.cumsum(counts) + counts, counts)
+            rows.append(np.repeat(select, counts))
+            cols.append(hit_c[first + np.arange(int(counts.sum()))])
+
+            # match the rest on their own text
+            for k in np.flatnonzero(redo).tolist():
+                window = text[starts[k] : ends[k]].strip()
+                found = [hashdict[m] for m in regex.findall(window)]
+                rows.append(np.full(len(found), select[k], dtype=np.int64))
+                cols.append(np.array(found, dtype=np.int64))
+
+        if rows:
+            rows = np.concatenate(rows)
+            cols = np.concatenate(cols)
+        return _aggregate_rows(
+            np.asarray(rows, dtype=np.int64),
+            np.asarray(cols, dtype=np.int64),
+            len(windows),
+            len(self.vocab),
+            self.mode,
+        )
+
+
+class HashingVectorizer(Vectorizer):
+    """
+    vocab-free Vectorizer using the hashing trick: terms are hashed (crc32)
+    straight to one of n_features columns, so no build_vocab pass is needed
+    and memory stays fixed however large the vocabulary grows
+    @param n_features: number of columns of the output matrix
+    @param ngrams: hash token n-grams of length 1 to ngrams (space joined,
+        as multigram vocab terms)
+    @param signed: alternate the sign of each column by a second hash bit so
+        collisions cancel in expectation rather than accumulate
+    @param mode: 'count', 'binary', 'tf' or 'l2' as Vectorizer; with signed
+        hashing 'binary' values are -1 or 1
+    @param dtype: dtype of the output matrix
+    @param token_regex: regular expression finding the tokens of a text
+    NOTE: hashes are stable across processes and runs, so matrices from
+        separate batches, workers or VectorizerPools line up
+    """
+
+    def __init__(
+        self,
+        n_features=2 ** 20,
+        ngrams=1,
+        signed=True,
+        mode="binary",
+        dtype=np.float64,
+        token_regex=r"\b[a-z0-9]+\b",
+    ):
+        assert (
+            mode in VECTORIZER_MODES
+        ), "Error: mode must be one of %s. Aborting." % (VECTORIZER_MODES,)
+        assert (
+            0 < n_features < 2 ** 31
+        ), "Error: n_features must be between 1 and 2**31. Aborting."
+        assert ngrams >= 1, "Error: ngrams must be at least 1. Aborting."
+        self.vocab = None
+        self.n_features = n_features
+        self.ngrams = ngrams
+        self.signed = signed
+        self.mode = mode
+        self.dtype = dtype
+        self.token_regex = token_regex
+        self._regex = None
+        self._custom_regex = False
+
+    def __len__(self):
+        return self.n_features
+
+    @property
+    def regex(self):
+        if self._regex is None:
+            self._regex = re.compile(self.token_regex)
+        return self._regex
+
+    def _terms(self, text):
+        tokens = self.regex.findall(text)
+        terms = tokens
+        for n in range(2, self.ngrams + 1):
+            terms = terms + [
+                " ".join(tokens[i : i + n])
+                for i in range(len(tokens) - n + 1)
+            ]
+        return terms
+
+    def _rows(self, texts):
+        """
+        return: (terms per text, concatenated sorted column indices, values)
+        """
+        # hash every term of the batch
+        hashes = []
+        lengths = []
+        for text in texts:
+            terms = self._terms(text)
+            lengths.append(len(terms))
+            hashes.extend([zlib.crc32(i.encode("utf-8")) for i in terms])
+        hashes = np.asarray(hashes, dtype=np.uint32)
+        rows = np.repeat(np.arange(len(lengths), dtype=np.int64), lengths)
+        cols = (hashes % self.n_features).astype(np.int64)
+        signs = 1.0 - 2.0 * (hashes >> 31)
+
+        return _aggregate_rows(
+            rows,
+            cols,
+            len(lengths),
+            self.n_features,
+            self.mode,
+            signs=signs if self.signed else None,
+        )
+
+
+def hash_vectorizer(
+    texts,
+    n_features=2 ** 20,
+    ngrams=1,
+    signed=True,
+    mode="binary",
+    dtype=np.float64,
+):
+    """
+    vectorize without a vocab; see HashingVectorizer
+    @param texts: string or list of preprocessed strings
+    @param n_features: number of columns of the output matrix
+    @param ngrams: hash token n-grams of length 1 to ngrams
+    @param signed: alternate column signs to offset hash collisions
+    @param mode: 'count', 'binary', 'tf' or 'l2'
+    @param dtype: dtype of the output matrix
+    return: sparse matrix (rows are texts, columns are hashed terms)
+    NOTE: for streams use HashingVectorizer.transform_batches, or pass a
+        HashingVectorizer to VectorizerPool for parallel transforms
+    """
+    return HashingVectorizer(
+        n_features=n_features,
+        ngrams=ngrams,
+        signed=signed,
+        mode=mode,
+        dtype=dtype,
+    ).transform(texts)
+
+
+def count_vectorizer(texts, vocab, regex=None, dtype=np.float64):
     """
     @param text: string or list of preprocessed strings
     @param vocab: vocab
+    @param regex: regular expression if available (higher speed)
+    @param dtype: dtype of the counts (e.g. np.uint8 to cut memory)
     return: sparse matrix (rows are input texts, columns are vocab)
+    NOTE: for repeated calls build a Vectorizer once and reuse it
     """
-    # initialize
-    if isinstance(texts, str):
-        texts = [texts]
-    hashdict = {k: v for v, k in enumerate(vocab)}
-    if not regex:
-        regex = text_tools.vocab_tools.vocab_regex(copy(vocab))
-
-    # iterate through texts
-    output = []
-    for i in range(len(texts)):
-        vector = np.zeros((1, len(vocab)))
-        for m in re.findall(regex, texts[i]):
-            vector[0, hashdict[m]] += 1
-        output.append(scipy.sparse.csr_matrix(vector))
-    return scipy.sparse.vstack(output)
+    return Vectorizer(vocab, mode="count", dtype=dtype, regex=regex).transform(
+        texts
+    )
 
 
-def tb_vectorizer(texts, vocab):
+def tb_vectorizer(texts, vocab, dtype=np.float64, pool=None):
     """
     returns sparse boolean matrix; rows are texts, columns are vocab terms
     @param texts: a string or list of strings
     @param vocab: a list of vocab
+    @param dtype: dtype of the matrix (e.g. bool or np.uint8 to cut memory)
+    @param pool: a VectorizerPool built on vocab, reused across calls
+    NOTE: without a pool, large inputs on linux run on a temporary pool and
+        everything else stays in-process
     """
     # initialize
-    if not texts:
-        return scipy.sparse.csr_matrix((0, len(vocab)))
     if isinstance(texts, str):
         texts = [texts]
-    global regex
-    regex = text_tools.vocab_tools.vocab_regex(vocab)
-    global hashdict
-    hashdict = dict({k: v for v, k in enumerate(vocab)})
-
-    # parallel if linux
-    if platform.system() == "Linux":
-        threadpool = Pool(cpu_count())
-        output = threadpool.map(_tb_unix_thread, texts)
-        threadpool.close()
-        threadpool.join()
-
-    # serial if not linux
-    else:
-        output = []
-        for text in texts:
-            vector = np.zeros((1, len(hashdict)))
-            for m in set(re.findall(regex, text)):
-                vector[0, hashdict[m]] = 1
-            output.append(scipy.sparse.csr_matrix(vector))
+    if pool is not None:
+        return pool.transform(texts, dtype=dtype)
+    if not texts:
+        return scipy.sparse.csr_matrix((0, len(vocab)), dtype=dtype)
+
+    # parallel if linux and worth the pool start-up
+    if platform.system() == "Linux" and len(texts) >= PARALLEL_MIN_TEXTS:
+        with VectorizerPool(vocab) as pool:
+            return pool.transform(texts, dtype=dtype)
+
+    # serial
+    return Vectorizer(vocab, mode="binary", dtype=dtype).transform(texts)
+
+
+# below this many texts pool start-up costs more than it saves
+PARALLEL_MIN_TEXTS = 1000
+
+
+class VectorizerPool(object):
+    """
+    persistent process pool running a Vectorizer in every worker
+    @param vocab: a list of vocab, or a Vectorizer (e.g. HashingVectorizer)
+    @param workers: number of worker processes, default cpu_count()
+    @param chunksize: texts shipped to a worker per task
+    @param min_parallel: inputs with fewer texts stay in-process
+    @param mode: Vectorizer mode when built from a vocab list
+    NOTE: each worker receives the Vectorizer once at start-up and returns
+        compact index arrays per chunk. The pool starts on first parallel
+        use; use as a context manager or call close().
+    """
+
+    def __init__(
+        self,
+        vocab,
+        workers=None,
+        chunksize=None,
+        min_parallel=None,
+        mode="binary",
+    ):
+        if not isinstance(vocab, Vectorizer):
+            vocab = Vectorizer(vocab, mode=mode)
+        self.vectorizer = vocab
+        self.workers = workers or cpu_count()
+        self.chunksize = chunksize
+        self.min_parallel = min_parallel
+        if min_parallel is None:
+            self.min_parallel = PARALLEL_MIN_TEXTS
+        self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def transform(self, texts, dtype=None):
+        """
+        @param texts: a string or list of strings
+        @param dtype: dtype of the matrix, default that of the Vectorizer
+        return: sparse matrix; rows are texts, columns are vocab
+        """
+        if isinstance(texts, str):
+            texts = [texts]
+        if not isinstance(texts, text_tools.extraction.WindowSet):
+            texts = list(texts)
+        if dtype is None:
+            dtype = self.vectorizer.dtype
+
+        # small inputs and windows (matched once per page) stay in-process
+        if (
+            self.workers < 2
+            or len(texts) < self.min_parallel
+            or isinstance(texts, text_tools.extraction.WindowSet)
+        ):
+            lengths, indices, data = self.vectorizer._rows(texts)
+
+        # else chunks to the workers
+        else:
+            if self._pool is None:
+                self._pool = Pool(
+                    self.workers,
+                    initializer=_init_vectorizer_worker,
+                    initargs=(self.vectorizer,),
+                )
+            chunksize = self.chunksize or max(
+                1, int(math.ceil(len(texts) / (4.0 * self.workers)))
+            )
+            chunks = [
+                texts[i : i + chunksize]
+                for i in range(0, len(texts), chunksize)
+            ]
+            output = self._pool.map(_vectorizer_worker_chunk, chunks)
+            lengths = np.concatenate([i[0] for i in output])
+            indices = np.concatenate([i[1] for i in output])
+            data = None
+            if output[0][2] is not None:
+                data = list(chain.from_iterable([i[2] for i in output]))
+        indptr = np.concatenate(([0], np.cumsum(lengths)))
+        return _build_csr(
+            indptr, indices, data, len(self.vectorizer), dtype
+        )
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
 
-    # delete globals and return
-    del regex
-    del hashdict
-    return scipy.sparse.vstack(output)
+def _init_vectorizer_worker(vectorizer):
+    global _worker_vectorizer
+    _worker_vectorizer = vectorizer
+    vectorizer.regex  # compile once per worker
 
 
-def _tb_unix_thread(text):
-    vector = np.zeros((1, len(hashdict)))
-    for m in set(re.findall(regex, text)):
-        vector[0, hashdict[m]] = 1
-    return scipy.sparse.csr_matrix(vector)
+def _vectorizer_worker_chunk(texts):
+    return _worker_vectorizer._rows(texts)
 
 
-def tf_vectorizer(texts, vocab, regex=None):
+def tf_vectorizer(texts, vocab, regex=None, dtype=np.float64):
     """
     @param text: string or list of preprocessed strings
     @param vocab: preprocesed vocab
     @param regex: regular expression if available (higher speed)
+    @param dtype: float dtype of the matrix (e.g. np.float32 to cut memory)
     return: sparse matrix (rows are texts, columns are tf)
     """
-    # initialize
     if isinstance(texts, str):
         texts = [texts]
-    hashdict = {k: v for v, k in enumerate(vocab)}
-    if not regex:
-        regex = text_tools.vocab_tools.vocab_regex(copy(vocab))
+    if not isinstance(texts, text_tools.extraction.WindowSet):
+        texts = tqdm(texts)
+    return Vectorizer(vocab, mode="l2", dtype=dtype, regex=regex).transform(
+        texts
+    )
 
-    # iterate through texts
-    output = []
-    for i in tqdm(range(len(texts))):
-        vector = np.zeros((1, len(vocab)))
-        for m in re.findall(regex, texts[i]):
-            vector[0, hashdict[m]] += 1
 
-        # return nothing if not enough information
-        vars_detected = np.count_nonzero(vector)
-        if vars_detected == 0:
-            output.append(scipy.sparse.csr_matrix((1, len(vocab))))
+def convolution_vectorizer(
+    texts,
+    vocab,
+    windowsize=100,
+    step=50,
+    mode="binary",
+    dtype=np.float64,
+    metadata=False,
+):
+    """
+    vectorize the sliding windows of texts without building them: each page
+    is matched once and its hits assigned to the windows containing them
+    @param texts: string or list of strings (pages)
+    @param vocab: a list of vocab, or a Vectorizer
+    @param windowsize: windowsize of sliding window in characters
+    @param step: step size used
+    @param mode: Vectorizer mode when built from a vocab list
+    @param dtype: dtype of the matrix when built from a vocab list
+    @param metadata: also return (page, wordid_start, wordid_end) arrays
+    return: sparse matrix (rows are windows, columns are vocab), equal to
+        vectorizing extraction.build_convolutions(texts, windowsize, step)
+    NOTE: texts with no windows give a matrix with no rows
+    """
+    if isinstance(texts, str):
+        texts = [texts]
+    if not isinstance(vocab, Vectorizer):
+        vocab = Vectorizer(vocab, mode=mode, dtype=dtype)
+    pages, starts, ends, token_starts, token_ends = (
+        text_tools.extraction.convolution_offsets(texts, windowsize, step)
+    )
+    matrix = vocab.transform(
+        text_tools.extraction.WindowSet(texts, pages - 1, starts, ends)
+    )
+    if metadata:
+        return matrix, (pages, token_starts, token_ends)
+    return matrix
+
+
+def tfidf_vectorizer(texts, frequencies, regex=None, dtype=np.float64):
+    """
+    @param texts: string or list of preprocessed strings
+    @param frequencies: vocab_tools.DocumentFrequencies of the vocab
+    @param regex: regular expression if available (higher speed)
+    @param dtype: float dtype of the matrix
+    return: sparse matrix (rows are texts, columns are l2 normalized tf-idf)
+    """
+    counts = count_vectorizer(
+        texts, frequencies.vocab, regex=regex, dtype=np.float64
+    )
+    return tfidf_weight(counts, frequencies).astype(dtype)
+
+
+def bm25_vectorizer(
+    texts, frequencies, k1=1.2, b=0.75, regex=None, dtype=np.float64
+):
+    """
+    @param texts: string or list of preprocessed strings
+    @param frequencies: vocab_tools.DocumentFrequencies of the vocab
+    @param k1: term frequency saturation
+    @param b: document length normalization
+    @param regex: regular expression if available (higher speed)
+    @param dtype: float dtype of the matrix
+    return: sparse matrix (rows are texts, columns are bm25 term weights)
+    """
+    counts = count_vectorizer(
+        texts, frequencies.vocab, regex=regex, dtype=np.float64
+    )
+    return bm25_weight(counts, frequencies, k1=k1, b=b).astype(dtype)
+
+
+def tfidf_weight(counts, frequencies, smooth=True, norm=True):
+    """
+    weight a count matrix by idf, as a sparse diagonal multiply
+    @param counts: sparse count matrix (rows are texts, columns are vocab)
+    @param frequencies: vocab_tools.DocumentFrequencies of the vocab
+    @param smooth: smooth idf (see DocumentFrequencies.idf)
+    @param norm: l2 normalize the rows
+    return: sparse tf-idf matrix
+    """
+    weights = counts.tocsr() @ scipy.sparse.diags(frequencies.idf(smooth))
+    if norm:
+        weights = normalize(weights, copy=False)
+    return weights
+
+
+def bm25_weight(counts, frequencies, k1=1.2, b=0.75):
+    """
+    weight a count matrix by okapi bm25
+    @param counts: sparse count matrix (rows are texts, columns are vocab)
+    @param frequencies: vocab_tools.DocumentFrequencies of the vocab
+    return: sparse matrix of tf * (k1 + 1) / (tf + k1 * (1 - b + b * len /
+        avg_len)) * idf, lengths counted in vocab terms
+    """
+    weights = counts.tocsr().astype(np.float64)
+    lengths = np.asarray(weights.sum(axis=1)).ravel()
+    lengths = np.repeat(lengths, np.diff(weights.indptr))
+    avg_len = frequencies.avg_doc_len or 1.0
+    tf = weights.data
+    weights.data = (
+        tf * (k1 + 1.0) / (tf + k1 * (1.0 - b + b * lengths / avg_len))
+    )
+    return weights @ scipy.sparse.diags(frequencies.bm25_idf())
+
+
+def _aggregate_rows(rows, cols, n_rows, n_cols, mode, signs=None):
+    """
+    return: (terms per row, concatenated sorted column indices, values)
+        from one (row, column) pair per term occurrence, weighted by mode
+    @param signs: weight of each occurrence; sums of zero are dropped
+    """
+    keys, inverse = np.unique(rows * n_cols + cols, return_inverse=True)
+    values = np.bincount(inverse.ravel(), weights=signs, minlength=len(keys))
+    if signs is not None:
+        keep = values != 0
+        keys = keys[keep]
+        values = values[keep]
+    rows = keys // n_cols
+    cols = keys % n_cols
+
+    # weighting
+    if mode == "binary":
+        values = np.sign(values)
+    elif mode == "tf":
+        values = values / np.bincount(
+            rows, weights=np.abs(values), minlength=n_rows
+        )[rows].astype(np.float64)
+    elif mode == "l2":
+        values = values / np.sqrt(
+            np.bincount(rows, weights=values ** 2.0, minlength=n_rows)
+        )[rows]
+    return (
+        np.bincount(rows, minlength=n_rows).astype(np.int32),
+        cols.astype(np.int32),
+        values,
+    )
 
-        # else sum of squares operation
-        else:
-            denominator = np.sqrt(np.sum(vector ** 2))
-            vector = vector / float(denominator)
-            output.append(scipy.sparse.csr_matrix(vector))
-    return scipy.sparse.vstack(output)
 
+def _clean_bounds(text, starts, ends):
+    """
+    return: bool array, true where text[start:end].strip() sees the same
+        word boundaries at its edges as the page does
+    """
+    last = len(text)
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    if not last:
+        return np.ones(len(starts), dtype=bool)
+    codes = np.frombuffer(
+        text.encode("utf-32-le", "surrogatepass"), dtype=np.uint32
+    )
+
+    def flags(positions):
+        # (is whitespace, is word character) of the characters at positions
+        chars = codes[np.clip(positions, 0, last - 1)]
+        ascii_chars = np.minimum(chars, 127)
+        space = _ASCII_SPACE[ascii_chars]
+        word = _ASCII_WORD[ascii_chars]
+        for k in np.flatnonzero(chars > 127).tolist():
+            char = chr(chars[k])
+            space[k] = char.isspace()
+            word[k] = bool(_RE_WORD_CHAR.match(char))
+        return space, word
+
+    space_s, _ = flags(starts)
+    _, word_before = flags(starts - 1)
+    space_e, _ = flags(ends - 1)
+    _, word_after = flags(ends)
+    clean_s = (starts == 0) | (starts >= last) | space_s | ~word_before
+    clean_e = (ends == 0) | (ends >= last) | space_e | ~word_after
+    return clean_s & clean_e
 
-def trif_vectorizer(texts):
+
+_RE_WORD_CHAR = re.compile(r"\w")
+_ASCII_SPACE = np.array([chr(i).isspace() for i in range(128)])
+_ASCII_WORD = np.array([bool(_RE_WORD_CHAR.match(chr(i))) for i in range(128)])
+
+
+def _build_csr(indptr, indices, data, n_cols, dtype):
+    """
+    return: csr matrix from accumulated rows (indices sorted within a row)
+    @param data: row values, or None for all ones
+    """
+    index_dtype = np.int32
+    if max(len(indices), n_cols) >= 2 ** 31:
+        index_dtype = np.int64
+    indices = np.asarray(indices, dtype=index_dtype)
+    if data is None:
+        data = np.ones(len(indices), dtype=dtype)
+    else:
+        data = np.asarray(data, dtype=dtype)
+    return scipy.sparse.csr_matrix(
+        (data, indices, np.asarray(indptr, dtype=index_dtype)),
+        shape=(len(indptr) - 1, n_cols),
+    )
+
+
+def trif_vectorizer(texts, batch_size=1000):
     """
     return a normalized vector of trigram character frequencies
     @param text: string or list of preprocessed strings
+    @param batch_size: texts counted per numpy pass
     # trigrams from 'abcdefghijklmnopqrstuvwxyz P' where P is punct
+    NOTE: texts are reduced with trigram_text, mapped to small integers and
+        trigram ids computed with array arithmetic over the fixed trigram
+        space, then counted per text without dense rows. Inputs are not
+        modified.
     """
     if isinstance(texts, str):
         texts = [texts]
-    re_punct = re.compile(r"[^a-z0-9\. ]")
-    re_nonalpha = re.compile(r"[^a-zP\.]+")
-    trigrams = pickle.load(
-        open(
-            os.path.join(
-                os.path.dirname(os.path.realpath(__file__)),
-                r"pickles",
-                "trigrams",
-            ),
-            "rb",
-        )
-    )
-    hashdict = {k: v for v, k in enumerate(trigrams)}
+    else:
+        texts = list(texts)
+    trigrams = resources.get("trigrams")
+    columns = _trigram_columns(trigrams)
+    n_cols = len(trigrams)
 
-    # iterate through texts
+    # iterate through batches of texts
     output = []
-    for i in range(len(texts)):
-
-        # preprocessing for variable reduction
-        texts[i] = re.sub(re_punct, r"P", texts[i].lower())
-        texts[i] = re.sub(re_nonalpha, r"  ", texts[i])
-
-        # counting
-        vector = np.zeros((1, len(hashdict)), dtype="float64")
-        counts = Counter(_ngrams(texts[i], 3))
-        for k, v in counts.items():
-            if k in hashdict:
-                vector[0, hashdict[k]] = v
-        vector = normalize(vector).ravel()
-        output.append(scipy.sparse.csr_matrix(vector))
-    return scipy.sparse.vstack(output)
-
-
-def _ngrams(text, n):
-    while True:
-        a, b = tee(text)
-        l = tuple(islice(a, n))
-        if len(l) == n:
-            yield l
-            next(b)
-            text = b
-        else:
-            break
+    for b in range(0, len(texts), batch_size):
+        batch = [
+            trigram_text(i).encode("ascii") for i in texts[b : b + batch_size]
+        ]
+        lengths = [len(i) for i in batch]
+        codes = _TRIGRAM_CODES[np.frombuffer(b"".join(batch), dtype=np.uint8)]
+        ends = np.cumsum(lengths)
+        rows = np.repeat(np.arange(len(batch)), lengths)
+
+        # trigram ids for every position whose trigram stays within its text
+        starts = np.arange(len(codes) - 2)
+        starts = starts[starts + 2 < ends[rows[starts]]]
+        ids = (
+            codes[starts] * len(_TRIGRAM_ALPHABET) ** 2
+            + codes[starts + 1] * len(_TRIGRAM_ALPHABET)
+            + codes[starts + 2]
+        )
+
+        # counting known trigrams per (text, column)
+        cols = columns[ids]
+        keep = cols >= 0
+        keys, counts = np.unique(
+            rows[starts][keep] * n_cols + cols[keep], return_counts=True
+        )
+        keys_rows = keys // n_cols
+        norms = np.sqrt(
+            np.bincount(keys_rows, weights=counts ** 2, minlength=len(batch))
+        )
+        indptr = np.concatenate(
+            ([0], np.cumsum(np.bincount(keys_rows, minlength=len(batch))))
+        )
+        output.append(
+            _build_csr(
+                indptr,
+                keys % n_cols,
+                counts / norms[keys_rows],
+                n_cols,
+                "float64",
+            )
+        )
+    if not output:
+        return scipy.sparse.csr_matrix((0, n_cols), dtype="float64")
+    return scipy.sparse.vstack(output, format="csr")
+
+
+def trigram_text(text):
+    """
+    return: text reduced to the trif_vectorizer alphabet (lowercase letters,
+        space, '.' and P for any other punct; digits and whitespace runs
+        collapse to two spaces)
+    """
+    text = _RE_TRIGRAM_PUNCT.sub("P", text.lower())
+    return _RE_TRIGRAM_NONALPHA.sub("  ", text)
+
+
+_TRIGRAM_ALPHABET = " abcdefghijklmnopqrstuvwxyzP."
+_RE_TRIGRAM_PUNCT = re.compile(r"[^a-z0-9\. ]")
+_RE_TRIGRAM_NONALPHA = re.compile(r"[^a-zP\.]+")
+
+# ascii byte -> position in _TRIGRAM_ALPHABET
+_TRIGRAM_CODES = np.zeros(256, dtype=np.int64)
+for _i, _c in enumerate(_TRIGRAM_ALPHABET):
+    _TRIGRAM_CODES[ord(_c)] = _i
+
+_trigram_column_maps = {}
+
+
+def _trigram_columns(trigrams):
+    """
+    return: array mapping every trigram id to its column in trigrams, or -1
+    NOTE: built once per trigram list object (resources.override swaps it)
+    """
+    columns = _trigram_column_maps.get(id(trigrams))
+    if columns is None or columns[0] is not trigrams:
+        n = len(_TRIGRAM_ALPHABET)
+        index = {k: v for v, k in enumerate(_TRIGRAM_ALPHABET)}
+        mapping = np.full(n ** 3, -1, dtype=np.int64)
+        for column, trigram in enumerate(trigrams):
+            a, b, c = [index[i] for i in trigram]
+            mapping[a * n * n + b * n + c] = column
+        columns = (trigrams, mapping)
+        _trigram_column_maps.clear()
+        _trigram_column_maps[id(trigrams)] = columns
+    return columns[1]
@@ -2,7 +2,15 @@
 # This is a set of python tools for constructing a vocabulary and IDF
 
 import re
-from copy import copy
+import math
+import zlib
+import pickle
+import numpy as np
+from functools import partial
+from itertools import islice
+from collections import Counter
+from multiprocessing import Pool
+import text_tools.stems
 import text_tools.words
 import text_tools.preprocessing
 import text_tools.vectorizer
@@ -14,28 +22,194 @@ def vocab_regex(vocab, ignorecase=False):
     @param vocab: a list of phrases
     return: a regular expression to search for all phrases 
     NOTE: enabling ignore case is significantly slower
+    NOTE: phrases are compiled as a prefix trie rather than one alternative
+        per phrase, so matching cost no longer grows with vocab size. The
+        longest phrase bounded by word boundaries still wins, as with the
+        length-sorted alternation. Phrases are matched literally.
     """
     if isinstance(vocab, str):
         vocab = [vocab]
     assert len(vocab) == len(
         list(set(vocab))
     ), "Error: repeat phrase found in vocabulary"
-    vocab = copy(vocab)
-    vocab.sort(key=len, reverse=True)
-    vocab = r"\b(" + r"|".join(vocab) + r")\b"
-    vocab = re.sub(r"""\-""", r"""\-""", vocab)
-    vocab = re.sub(r"""\.""", r"""\.""", vocab)
+    if ignorecase == True:
+        vocab = [i.lower() for i in vocab]
+    vocab = r"\b(" + _trie_pattern(_build_trie(vocab)) + r")\b"
     if ignorecase == True:
         return re.compile(vocab, re.IGNORECASE)
     return re.compile(vocab)
 
 
-def build_vocab(text, multigram=False, vocab_init=[]):
+def _build_trie(vocab):
+    # nested dicts keyed by character, "" marks the end of a phrase
+    trie = {}
+    for phrase in vocab:
+        node = trie
+        for char in phrase:
+            node = node.setdefault(char, {})
+        node[""] = True
+    return trie
+
+
+def _trie_pattern(node):
+    """
+    return: regex matching every phrase below node, longest first
+    NOTE: single-child chains collapse into one escaped literal
+    """
+    branches = []
+    for char in sorted(k for k in node if k):
+        child = node[char]
+        literal = char
+        while len(child) == 1 and "" not in child:
+            (char, child), = child.items()
+            literal += char
+        branches.append(re.escape(literal) + _trie_pattern(child))
+    if not branches:
+        return ""
+    if len(branches) == 1 and "" not in node:
+        return branches[0]
+    pattern = "(?:" + "|".join(branches) + ")"
+    if "" in node:
+        pattern += "?"
+    return pattern
+
+
+def build_vocab(
+    text, multigram=False, vocab_init=[], min_count=3, min_pmi=3.0
+):
     """
     @param text: string
-    @param multigram: intelligently pull multigrams
+    @param multigram: intelligently pull multigrams (see Collocations)
     @param vocab_init: seperately confirmed vocab
+    @param min_count: multigrams must occur at least this often
+    @param min_pmi: multigrams must have at least this pmi (bits)
     return: vocab, in alphabetical order. Accepts alphas>=3 letters.
+    NOTE: for corpora that do not fit in one string use count_vocab
+    """
+    phrases = Collocations() if multigram else None
+    vocab = _vocab_terms(text, phrases) + _vocab_init(vocab_init)
+    if multigram:
+        vocab += [i[0] for i in phrases.phrases(min_count, min_pmi)]
+    vocab = [i for i in set(vocab) if i and i not in _stop_stemmed()]
+    vocab.sort()
+    return vocab
+
+
+def count_vocab(
+    texts,
+    multigram=False,
+    vocab_init=[],
+    min_df=1,
+    max_df=1.0,
+    max_features=None,
+    min_count=3,
+    min_pmi=3.0,
+    workers=None,
+    chunksize=100,
+):
+    """
+    build_vocab over a stream of documents, counting every type
+    @param texts: iterable of documents, consumed lazily
+    @param multigram: intelligently pull multigrams (see Collocations)
+    @param vocab_init: seperately confirmed vocab, kept whatever its counts
+    @param min_df: drop terms in fewer documents (int) or a lower proportion
+        of documents (float)
+    @param max_df: drop terms in more documents (int) or a higher proportion
+        of documents (float)
+    @param max_features: keep only the most frequent terms
+    @param min_count: multigrams must occur at least this often
+    @param min_pmi: multigrams must have at least this pmi (bits)
+    @param workers: count in this many processes, each chunk on a Counter
+        merged as the results return
+    @param chunksize: documents per worker task
+    return: (vocab in alphabetical order, list of their term counts)
+    NOTE: min_df and max_df prune single terms; multigrams are kept by
+        min_count and min_pmi over the whole stream
+    """
+    term_counts = Counter()
+    doc_counts = Counter()
+    phrases = Collocations() if multigram else None
+    n_docs = 0
+    chunks = _chunks(texts, chunksize)
+
+    # serial
+    if not workers or workers < 2:
+        for chunk in chunks:
+            tf, df, n, _ = _count_chunk(chunk, phrases=phrases)
+            term_counts.update(tf)
+            doc_counts.update(df)
+            n_docs += n
+
+    # parallel, feeding a bounded number of chunks at a time
+    else:
+        with Pool(workers) as pool:
+            while True:
+                batch = list(islice(chunks, 2 * workers))
+                if not batch:
+                    break
+                for tf, df, n, chunk_phrases in pool.map(
+                    partial(_count_chunk, multigram=multigram), batch
+                ):
+                    term_counts.update(tf)
+                    doc_counts.update(df)
+                    n_docs += n
+                    if multigram:
+                        phrases.merge(chunk_phrases)
+
+    # frequency pruning
+    if isinstance(min_df, float):
+        min_df = min_df * n_docs
+    if isinstance(max_df, float):
+        max_df = max_df * n_docs
+    stop_stemmed = _stop_stemmed()
+    vocab = [
+        k
+        for k, v in doc_counts.items()
+        if min_df <= v <= max_df and k and k not in stop_stemmed
+    ]
+    if multigram:
+        for phrase, count, _ in phrases.phrases(min_count, min_pmi):
+            if phrase not in stop_stemmed:
+                vocab.append(phrase)
+                term_counts[phrase] = count
+    if max_features is not None:
+        vocab.sort(key=lambda x: (-term_counts[x], x))
+        vocab = vocab[:max_features]
+    vocab = list(
+        set(vocab)
+        | set(i for i in _vocab_init(vocab_init) if i not in stop_stemmed)
+    )
+    vocab = [i for i in vocab if i]
+    vocab.sort()
+    return vocab, [term_counts[i] for i in vocab]
+
+
+def _chunks(texts, chunksize):
+    texts = iter(texts)
+    while True:
+        chunk = list(islice(texts, chunksize))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _count_chunk(texts, multigram=False, phrases=None):
+    # term and document counts of one chunk, run in the workers
+    if multigram and phrases is None:
+        phrases = Collocations()
+    term_counts = Counter()
+    doc_counts = Counter()
+    for text in texts:
+        terms = _vocab_terms(text, phrases)
+        term_counts.update(terms)
+        doc_counts.update(set(terms))
+    return term_counts, doc_counts, len(texts), phrases
+
+
+def _vocab_terms(text, phrases=None):
+    """
+    return: stemmed vocab candidates of a text, with repeats
+    @param phrases: Collocations to count the text's multigrams into
     """
     text = text_tools.preprocessing.force_ascii(text)
     text = text_tools.preprocessing.remove_false_periods(text)
@@ -45,32 +219,258 @@ def build_vocab(text, multigram=False, vocab_init=[]):
     text = text_tools.preprocessing.force_lower(text)
     text = text_tools.preprocessing.force_punct(text)
 
-    stop = list(ENGLISH_STOP_WORDS)
-    stop_stemmed = text_tools.preprocessing.stem_all(stop)
-    vocab = list(
-        set(abbrevs + re.findall(r"\b[a-z]{2,40}\b", text) + vocab_init)
-    )
-    vocab = [i for i in vocab if i not in stop]
-    vocab = text_tools.preprocessing.stem_all(vocab)
+    terms = abbrevs + re.findall(r"\b[a-z]{2,40}\b", text)
+    terms = [i for i in terms if i not in ENGLISH_STOP_WORDS]
+    terms = text_tools.preprocessing.stem_all(terms)
+    if phrases is not None:
+        phrases.add_segments(_phrase_segments(text, abbrevs))
+    return terms
 
-    if multigram:
 
-        # split text by stopwords and punct delimiters
-        stopwords = [i for i in ENGLISH_STOP_WORDS] + abbrevs
-        stopwords.sort(key=len, reverse=True)
-        stopwords = r"\b" + r"\b|\b".join(stopwords) + r"\b"
-        punct = r"(?![a-z]+\b)[a-z0-9]+\b|\b[a-z]\b|[^a-z0-9 ]+"
-        regex_stops = re.compile(stopwords + r"|" + punct)
-        subtexts = re.split(regex_stops, text) + abbrevs
-        subtexts = [i.strip() for i in subtexts]
-        subtexts = text_tools.preprocessing.stem_all(subtexts)
-        subtexts.sort()
-        vocab = vocab + subtexts
-
-    # for each substring, tokenize chains up to max-ngram length
-    vocab = [i for i in list(set(vocab)) if i and i not in stop_stemmed]
-    vocab.sort()
-    return vocab
+def _phrase_segments(text, abbrevs=()):
+    """
+    return: stemmed token lists between stopword, punct and abbreviation
+        delimiters of a lowercased, punct-forced text
+    """
+    regex_stops = _RE_MULTIGRAM_STOPS
+    if abbrevs:
+        regex_stops = re.compile(
+            r"\b(?:" + "|".join(set(abbrevs)) + r")\b|" + regex_stops.pattern
+        )
+    stem = text_tools.stems.cache.stem
+    segments = []
+    for subtext in re.split(regex_stops, text):
+        tokens = subtext.split()
+        if len(tokens) > 1:
+            segments.append(
+                [
+                    stem(i) if len(i) >= 3 and i.isalpha() else i
+                    for i in tokens
+                ]
+            )
+    return segments
+
+
+class Collocations(object):
+    """
+    streamed multigram (collocation) discovery: counts the n-grams of
+    stopword-delimited segments in one pass and keeps phrases that are both
+    frequent and far likelier together than apart (pointwise mutual
+    information)
+    @param max_n: longest multigram, in tokens
+    @param max_candidates: n-gram table size that triggers pruning
+    NOTE: n-gram counts are exact until the table outgrows max_candidates.
+        From then on every n-gram is also counted in a fixed-size count-min
+        sketch (4 rows of at least 2 * max_candidates counters), and each
+        prune keeps the half of the table with the highest sketch counts, so
+        a pruned n-gram returns once it is frequent. Table counts are then
+        lower bounds (occurrences before readmission are missed), while pmi
+        takes the counts of a phrase's parts from the sketch, an upper bound;
+        pmi thus errs low, never high. Unigrams are counted exactly and are
+        not bounded. Counts from separate chunks or processes combine with
+        merge().
+    """
+
+    def __init__(self, max_n=3, max_candidates=2 ** 20):
+        assert max_n >= 2, "Error: max_n must be at least 2. Aborting."
+        self.max_n = max_n
+        self.max_candidates = max_candidates
+        self.unigrams = Counter()
+        self.ngrams = Counter()
+        self.n_tokens = 0
+        self.sketch = None
+        self._bits = max(16, (2 * max_candidates - 1).bit_length())
+
+    def __len__(self):
+        return len(self.ngrams)
+
+    def update(self, texts):
+        """
+        @param texts: string or iterable of raw documents
+        return: self
+        """
+        if isinstance(texts, str):
+            texts = [texts]
+        for text in texts:
+            _vocab_terms(text, self)
+        return self
+
+    def add_segments(self, segments):
+        """
+        @param segments: lists of stemmed tokens no multigram may cross
+        """
+        grams = []
+        for tokens in segments:
+            self.unigrams.update(tokens)
+            self.n_tokens += len(tokens)
+            for n in range(2, min(self.max_n, len(tokens)) + 1):
+                grams.extend(
+                    [
+                        " ".join(tokens[i : i + n])
+                        for i in range(len(tokens) - n + 1)
+                    ]
+                )
+        self.ngrams.update(grams)
+        if self.sketch is not None:
+            self._sketch_add(grams)
+        if len(self.ngrams) > self.max_candidates:
+            self._prune()
+
+    def merge(self, other):
+        """
+        add the counts of other to self
+        return: self
+        """
+        assert (
+            other._bits == self._bits
+        ), "Error: counted with another max_candidates. Aborting."
+        if self.sketch is None and other.sketch is not None:
+            self._start_sketch()
+        if self.sketch is not None:
+            if other.sketch is None:
+                grams = list(other.ngrams)
+                self._sketch_add(grams, [other.ngrams[i] for i in grams])
+            else:
+                self.sketch += other.sketch
+        self.unigrams.update(other.unigrams)
+        self.ngrams.update(other.ngrams)
+        self.n_tokens += other.n_tokens
+        if len(self.ngrams) > self.max_candidates:
+            self._prune()
+        return self
+
+    def pmi(self, phrase):
+        """
+        return: pointwise mutual information of phrase in bits, taken at its
+            weakest split, min(log2(p(phrase) / (p(left) * p(right))))
+        NOTE: scoring every split keeps a weak token from riding on a strong
+            collocation beside it (e.g. 'rash congestive heart')
+        """
+        tokens = phrase.split()
+        count = self.ngrams[phrase]
+        score = None
+        for i in range(1, len(tokens)):
+            left = self._count(tokens[:i])
+            right = self._count(tokens[i:])
+            split = math.log2(
+                count
+                * float(self.n_tokens)
+                / (max(left, count) * max(right, count))
+            )
+            if score is None or split < score:
+                score = split
+        return score
+
+    def phrases(self, min_count=3, min_pmi=3.0):
+        """
+        @param min_count: minimum occurrences of a phrase
+        @param min_pmi: minimum pmi of a phrase, in bits
+        return: list of (phrase, count, pmi), highest pmi first
+        """
+        output = []
+        for phrase, count in self.ngrams.items():
+            if count >= min_count:
+                score = self.pmi(phrase)
+                if score >= min_pmi:
+                    output.append((phrase, count, score))
+        output.sort(key=lambda x: (-x[2], x[0]))
+        return output
+
+    def _count(self, tokens):
+        if len(tokens) == 1:
+            return self.unigrams[tokens[0]]
+        if self.sketch is None:
+            return self.ngrams[" ".join(tokens)]
+        # upper bound, as the part may have been pruned and readmitted
+        return int(self._estimate([" ".join(tokens)])[0])
+
+    def _prune(self):
+        # keep the half of the table with the highest (sketch) counts
+        if self.sketch is None:
+            self._start_sketch()
+        grams = list(self.ngrams)
+        estimates = self._estimate(grams)
+        keep = np.argsort(-estimates, kind="stable")
+        keep = keep[: self.max_candidates // 2]
+        self.ngrams = Counter({grams[i]: self.ngrams[grams[i]] for i in keep})
+
+    def _start_sketch(self):
+        # the table is still exact here, so it seeds the sketch in full
+        self.sketch = np.zeros(
+            (len(_SKETCH_MULTIPLIERS), 1 << self._bits), dtype=np.int32
+        )
+        grams = list(self.ngrams)
+        self._sketch_add(grams, [self.ngrams[i] for i in grams])
+
+    def _sketch_columns(self, grams):
+        # multiply-shift hashes of each n-gram's crc32, one per sketch row
+        keys = np.fromiter(
+            (zlib.crc32(i.encode("utf-8", "surrogatepass")) for i in grams),
+            dtype=np.uint64,
+            count=len(grams),
+        )
+        return (keys * _SKETCH_MULTIPLIERS[:, None]) >> np.uint64(
+            64 - self._bits
+        )
+
+    def _sketch_add(self, grams, counts=1):
+        columns = self._sketch_columns(grams)
+        for row in range(len(columns)):
+            np.add.at(self.sketch[row], columns[row], counts)
+
+    def _estimate(self, grams):
+        columns = self._sketch_columns(grams)
+        return np.min(
+            [self.sketch[row][columns[row]] for row in range(len(columns))],
+            axis=0,
+        )
+
+
+_SKETCH_MULTIPLIERS = np.array(
+    [
+        0x9E3779B97F4A7C15,
+        0xC2B2AE3D27D4EB4F,
+        0x165667B19E3779F9,
+        0xD6E8FEB86659FD93,
+    ],
+    dtype=np.uint64,
+)
+
+
+def collocations(texts, max_n=3, min_count=3, min_pmi=3.0):
+    """
+    @param texts: string or iterable of raw documents, streamed
+    @param max_n: longest multigram, in tokens
+    @param min_count: minimum occurrences of a phrase
+    @param min_pmi: minimum pmi of a phrase, in bits
+    return: list of (stemmed phrase, count, pmi), highest pmi first
+    """
+    return Collocations(max_n=max_n).update(texts).phrases(min_count, min_pmi)
+
+
+def _vocab_init(vocab_init):
+    if isinstance(vocab_init, str):
+        vocab_init = [vocab_init]
+    vocab_init = [i for i in vocab_init if i not in ENGLISH_STOP_WORDS]
+    return text_tools.preprocessing.stem_all(vocab_init)
+
+
+def _stop_stemmed():
+    global _STOP_STEMMED
+    if _STOP_STEMMED is None:
+        _STOP_STEMMED = frozenset(
+            text_tools.preprocessing.stem_all(list(ENGLISH_STOP_WORDS))
+        )
+    return _STOP_STEMMED
+
+
+_STOP_STEMMED = None
+_RE_MULTIGRAM_STOPS = re.compile(
+    r"\b(?:"
+    + _trie_pattern(_build_trie(ENGLISH_STOP_WORDS))
+    + r")\b"
+    + r"|(?![a-z]+\b)[a-z0-9]+\b|\b[a-z]\b|[^a-z0-9 ]+"
+)
 
 
 def vocab_counts(text, vocab):
@@ -84,6 +484,151 @@ def vocab_counts(text, vocab):
     return counts
 
 
+class DocumentFrequencies(object):
+    """
+    document frequencies of a vocab, accumulated in a single streamed pass
+    and stored alongside the vocab, for idf and bm25 weighting
+    @param vocab: a list of vocab, or a count-mode Vectorizer on it
+    NOTE: frequencies from separate processes or corpus shards combine with
+        merge() or +, so counting parallelizes like any map-reduce
+    """
+
+    def __init__(self, vocab):
+        if isinstance(vocab, text_tools.vectorizer.Vectorizer):
+            assert (
+                vocab.mode == "count"
+            ), "Error: vectorizer must be in count mode. Aborting."
+            self._vectorizer = vocab
+            vocab = vocab.vocab
+        else:
+            self._vectorizer = None
+        self.vocab = list(vocab)
+        self.df = np.zeros(len(self.vocab), dtype=np.int64)
+        self.n_docs = 0
+        self.n_terms = 0
+
+    def __len__(self):
+        return len(self.vocab)
+
+    def __add__(self, other):
+        return DocumentFrequencies(self.vocab).merge(self).merge(other)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_vectorizer"] = None
+        return state
+
+    @property
+    def avg_doc_len(self):
+        # mean vocab terms matched per document
+        if not self.n_docs:
+            return 0.0
+        return self.n_terms / float(self.n_docs)
+
+    def update(self, texts, batch_size=1000, pool=None):
+        """
+        count documents containing each vocab term
+        @param texts: string or iterable of preprocessed strings, consumed
+            lazily batch_size at a time
+        @param pool: a count-mode VectorizerPool on the same vocab
+        return: self
+        """
+        assert (
+            pool is None or pool.vectorizer.mode == "count"
+        ), "Error: pool vectorizer must be in count mode. Aborting."
+        if isinstance(texts, str):
+            texts = [texts]
+        batch = []
+        for text in texts:
+            batch.append(text)
+            if len(batch) >= batch_size:
+                self._update_batch(batch, pool)
+                batch = []
+        if batch:
+            self._update_batch(batch, pool)
+        return self
+
+    def update_counts(self, counts):
+        """
+        @param counts: count matrix of documents (rows) by vocab (columns),
+            e.g. from count_vectorizer or a ShardedMatrix shard
+        return: self
+        """
+        assert counts.shape[1] == len(
+            self.vocab
+        ), "Error: counts do not match the vocab. Aborting."
+        counts = counts.tocsr()
+        nonzero = counts.data != 0
+        self.df += np.bincount(
+            counts.indices[nonzero], minlength=len(self.vocab)
+        )
+        self.n_docs += counts.shape[0]
+        self.n_terms += int(counts.sum())
+        return self
+
+    def merge(self, other):
+        """
+        add the frequencies of other (counted on the same vocab) to self
+        return: self
+        """
+        assert (
+            other.vocab == self.vocab
+        ), "Error: frequencies were counted on another vocab. Aborting."
+        self.df += other.df
+        self.n_docs += other.n_docs
+        self.n_terms += other.n_terms
+        return self
+
+    def idf(self, smooth=True):
+        """
+        return: array of inverse document frequencies,
+            ln((1 + n) / (1 + df)) + 1 when smooth else ln(n / df) + 1
+        """
+        if smooth:
+            return np.log((1.0 + self.n_docs) / (1.0 + self.df)) + 1.0
+        with np.errstate(divide="ignore"):
+            return np.log(float(self.n_docs) / self.df) + 1.0
+
+    def bm25_idf(self):
+        """
+        return: array of bm25 idf, ln(1 + (n - df + 0.5) / (df + 0.5))
+        """
+        return np.log(1.0 + (self.n_docs - self.df + 0.5) / (self.df + 0.5))
+
+    def save(self, path):
+        with open(path, "wb") as fp:
+            pickle.dump(self, fp)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as fp:
+            return pickle.load(fp)
+
+    def _update_batch(self, batch, pool):
+        if pool is not None:
+            counts = pool.transform(batch)
+        else:
+            if self._vectorizer is None:
+                self._vectorizer = text_tools.vectorizer.Vectorizer(
+                    self.vocab, mode="count"
+                )
+            counts = self._vectorizer.transform(batch)
+        self.update_counts(counts)
+
+
+def document_frequencies(texts, vocab, batch_size=1000, pool=None):
+    """
+    @param texts: iterable of preprocessed strings, streamed
+    @param vocab: a list of vocab
+    @param batch_size: texts counted per batch
+    @param pool: a count-mode VectorizerPool on the vocab
+    return: DocumentFrequencies of the vocab over texts
+    """
+    return DocumentFrequencies(vocab).update(
+        texts, batch_size=batch_size, pool=pool
+    )
+
+
 def vocab_preprocess(vocab, max_length=40):
     """
     @param vocab: a list or line-return seperated list of vocab